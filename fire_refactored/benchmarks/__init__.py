@@ -0,0 +1 @@
+"""Offline benchmarks for the finance package hot paths; see bench_finance.py."""
@@ -0,0 +1,127 @@
+"""Timing benchmarks for the finance package with a stored baseline.
+
+Run from the fire_refactored directory:
+    python -m benchmarks.bench_finance            # compare against baseline.json, exit 1 on regression
+    python -m benchmarks.bench_finance --save     # record a new baseline for this machine
+    python -m benchmarks.bench_finance -k project # only cases whose name contains "project"
+
+Each case is timed alternately with a fixed reference workload, and the gate compares the
+case's time in units of the reference. Machine load and speed then cancel out, so a baseline
+recorded on one run passes on the next; a case over the tolerance is re-timed before it counts
+as a regression.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import Callable, Dict, Tuple
+import numpy as np
+from finance.models import Person, Loan, Investment
+from finance.loans import annuity_payment, amortization_schedule, amortize
+from finance.tax import TaxConfig, TaxEngine
+from finance.simulation import Simulation
+from finance.decumulation import safe_withdrawal_rate
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+ACCOUNTS = ('brokerage', 'ASK', 'IPS')
+
+def make_person(n_loans: int = 1, n_investments: int = 2) -> Person:
+    return Person(name='bench', salary=650000.0, savings_rate=0.25, expenses=300000.0, ips_contribution=15000.0,
+                  loans=[Loan(principal=1_500_000.0 + 250_000*i, annual_rate=0.04 + 0.005*i, years=20 + i) for i in range(n_loans)],
+                  investments=[Investment(principal=100000.0*(i+1), annual_return=0.05 + 0.01*i, account_type=ACCOUNTS[i % 3]) for i in range(n_investments)])
+
+def cases() -> Dict[str, Callable[[], object]]:
+    sim = Simulation()
+    engine = TaxEngine(TaxConfig())
+    loan = Loan(principal=3_000_000.0, annual_rate=0.05, years=30)
+    incomes = np.linspace(0, 2_000_000, 10_000)
+    df = sim.project_yearly(make_person(), years=30)
+    out = {
+        'annuity_payment': lambda: annuity_payment(3_000_000.0, 0.05, 30),
+        'amortization_schedule_30y': lambda: amortization_schedule(loan),
+        'amortize_30y': lambda: amortize(loan),
+        'bracket_tax_scalar': lambda: engine.bracket_tax(650000.0),
+        'income_tax_scalar': lambda: engine.income_tax(650000.0, deductions=15000.0),
+        'income_tax_array_10k': lambda: engine.income_tax(incomes, deductions=15000.0),
+        'realize_and_tax': lambda: sim.realize_and_tax(df, realize_ask=100000.0, realize_brokerage=100000.0, realize_ips_withdraw=50000.0),
+        'format_table': lambda: sim.format_table(df, maxrows=30),
+        'safe_withdrawal_rate_10k_paths': lambda: safe_withdrawal_rate(make_person(n_loans=0, n_investments=3), years=30, n_paths=10_000, seed=1),
+    }
+    for years in (10, 30, 60):
+        for n in (0, 1, 5):
+            person = make_person(n_loans=n, n_investments=n)
+            out[f'project_yearly_{years}y_{n}loans_{n}inv'] = lambda p=person, y=years: sim.project_yearly(p, years=y)
+    return out
+
+def reference() -> float:
+    # fixed mix of small NumPy calls and interpreter work, like the cases themselves
+    x = np.linspace(0.0, 1.0, 360)
+    for _ in range(10):
+        x = np.cumsum(np.sqrt(x + 1.0)) / 360
+    return float(sum(sorted(range(100), key=lambda i: -i)) + x[-1])
+
+def _number(timer: timeit.Timer, min_time: float) -> int:
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return number
+
+def measure(fn: Callable[[], object], repeat: int = 9, min_time: float = 0.05) -> Tuple[float, float]:
+    """Best-of-`repeat` seconds per call of fn and of reference(), timed alternately."""
+    timers = [timeit.Timer(fn), timeit.Timer(reference)]
+    numbers = [_number(t, min_time) for t in timers]
+    best = [float('inf'), float('inf')]
+    for _ in range(repeat):
+        for i, (timer, number) in enumerate(zip(timers, numbers)):
+            best[i] = min(best[i], timer.timeit(number) / number)
+    return best[0], best[1]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--save', action='store_true', help='write results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='fail when slower than tolerance x baseline')
+    parser.add_argument('--repeat', type=int, default=9, help='timing rounds per case; the best round counts')
+    parser.add_argument('--retries', type=int, default=2, help='re-time a case this often before reporting it as a regression')
+    parser.add_argument('-k', dest='pattern', default='', help='substring filter on case names')
+    parser.add_argument('--baseline', default=BASELINE)
+    args = parser.parse_args(argv)
+    recorded = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            recorded = json.load(f)
+    baseline, relative = recorded.get('results', {}), recorded.get('relative', {})
+    results, units, regressions = {}, {}, []
+    for name, fn in cases().items():
+        if args.pattern not in name:
+            continue
+        seconds, unit = measure(fn, repeat=args.repeat)
+        ref = relative.get(name)
+        for _ in range(args.retries if ref and not args.save else 0):
+            # a load spike can outlast one measurement; a real slowdown survives every retry
+            if seconds / unit <= args.tolerance * ref:
+                break
+            seconds, unit = min((seconds, unit), measure(fn, repeat=args.repeat), key=lambda m: m[0] / m[1])
+        results[name], units[name] = seconds, seconds / unit
+        ratio = units[name] / ref if ref else float('nan')
+        flag = ''
+        if ref and ratio > args.tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<36} {seconds*1e6:12.1f} us   x{ratio:5.2f}{flag}')
+    if args.save:
+        meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(), 'processor': platform.processor()}
+        # results are seconds on the recording machine, for reading; relative is what the gate compares
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'results': {**baseline, **results}, 'relative': {**relative, **units}}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'baseline written to {args.baseline}')
+        return 0
+    if regressions:
+        print(f'{len(regressions)} benchmark(s) slower than {args.tolerance}x baseline: {", ".join(regressions)}', file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
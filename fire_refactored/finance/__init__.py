@@ -1,6 +1,36 @@
-"""Finance package for FIRE simulator."""
-from .models import Person, Loan, Investment
-from .loans import amortization_schedule, annuity_payment
-from .tax import TaxConfig, TaxEngine
-from .simulation import Simulation
-__all__ = ['Person','Loan','Investment','amortization_schedule','annuity_payment','TaxConfig','TaxEngine','Simulation']
+"""Finance package for FIRE simulator.
+
+Exports are imported on first use, so e.g. `from finance import TaxEngine` loads only NumPy and
+the tax module; pandas and tabulate load once a DataFrame, table or export is requested.
+"""
+import importlib
+import importlib.util
+
+_EXPORTS = {
+    'models': ['Person', 'Household', 'Loan', 'Investment'],
+    'loans': ['amortization_schedule', 'annuity_payment', 'amortize', 'amortize_many', 'AmortizationSchedule', 'ScheduleBatch'],
+    'tax': ['TaxConfig', 'TaxEngine'],
+    'lots': ['LotBook'],
+    'cache': ['ResultCache', 'stable_hash'],
+    'simulation': ['Simulation', 'Checkpoint'],
+    'sweep': ['parameter_sweep'],
+    'profiling': ['Profiler'],
+    'optimize': ['optimize_allocation'],
+    'decumulation': ['WithdrawalStrategy', 'simulate_withdrawals', 'safe_withdrawal_rate'],
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+__all__ = list(_MODULES)
+
+def __getattr__(name):
+    if name in _MODULES:
+        value = getattr(importlib.import_module(f'.{_MODULES[name]}', __name__), name)
+    elif importlib.util.find_spec(f'{__name__}.{name}') is not None:
+        # submodules stay reachable as attributes, as with the former eager imports
+        value = importlib.import_module(f'.{name}', __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,195 @@
+"""Headless batch runner: project many scenarios from a file and stream one summary row each.
+
+Scenarios are read lazily from YAML/JSON (a list, or a mapping with a "scenarios" list),
+JSON Lines, or CSV. A scenario holds Person fields plus optional "id", "years", "inflation",
+"loans" and "investments"; in CSV the two lists and "lump_sums" are JSON strings. Rows are
+written to CSV or Parquet as soon as their chunk finishes, so memory stays bounded by the
+in-flight chunks.
+"""
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import fields
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import csv
+import json
+import os
+import sys
+import numpy as np
+from .models import Person, Loan, Investment, as_series
+from .tax import TaxConfig
+from .rules import config_from_file, tax_config as tax_config_for
+from .simulation import Simulation
+
+RESULT_COLUMNS = ('id', 'name', 'years', 'total_assets', 'debt', 'net_wealth', 'real_net_wealth', 'cumulative_contrib',
+                  'total_income_tax', 'total_wealth_tax', 'years_to_fire', 'error')
+PERSON_FIELDS = {f.name for f in fields(Person)}
+NUMERIC_FIELDS = {f.name for f in fields(Person) if f.type is float}
+
+def read_scenarios(path: str) -> Iterator[Dict[str, Any]]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    elif ext in ('.jsonl', '.ndjson'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif ext in ('.json', '.yaml', '.yml'):
+        with open(path, encoding='utf-8') as f:
+            if ext == '.json':
+                data = json.load(f)
+            else:
+                import yaml
+                data = yaml.safe_load(f)
+        yield from data.get('scenarios', []) if isinstance(data, dict) else data
+    else:
+        raise ValueError(f"Unsupported scenario file type {ext!r}; use .yaml, .json, .jsonl or .csv")
+
+def _number_or_path(value):
+    # time-varying fields arrive as lists (or JSON list strings in CSV)
+    if isinstance(value, str):
+        value = json.loads(value) if value.lstrip().startswith('[') else float(value)
+    return float(value) if np.ndim(value) == 0 else np.asarray(value, dtype=float)
+
+def parse_scenario(raw: Dict[str, Any], index: int = 0) -> Tuple[str, Person, Dict[str, Any]]:
+    """Turn one raw record into (id, Person, options); CSV strings are converted here."""
+    data = {k: v for k, v in raw.items() if v not in (None, '')}
+    options = {k: data.pop(k) for k in ('years', 'inflation') if k in data}
+    scenario_id = str(data.pop('id', index))
+    loans = data.pop('loans', [])
+    investments = data.pop('investments', [])
+    loans = json.loads(loans) if isinstance(loans, str) else loans
+    investments = json.loads(investments) if isinstance(investments, str) else investments
+    if isinstance(data.get('lump_sums'), str):
+        data['lump_sums'] = json.loads(data['lump_sums'])
+    if 'retirement_year' in data:
+        data['retirement_year'] = int(data['retirement_year'])
+    unknown = set(data) - PERSON_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown scenario fields: {sorted(unknown)}")
+    data = {k: _number_or_path(v) if k in NUMERIC_FIELDS else v for k, v in data.items()}
+    data.setdefault('name', scenario_id)
+    person = Person(**data, loans=[Loan(**l) for l in loans], investments=[Investment(**i) for i in investments])
+    return scenario_id, person, {'years': int(options.get('years', 30)), 'inflation': float(options.get('inflation', 0.02))}
+
+def summarize(sim: Simulation, person: Person, years: int, inflation: float, withdrawal_rate: float) -> Dict[str, Any]:
+    summary = sim.summary(person, years, inflation, withdrawal_rate)
+    fire = summary.pop('years_to_fire')
+    return {'name': person.name, 'years': years, **summary, 'years_to_fire': None if np.isnan(fire) else int(fire)}
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+_worker_sim: Optional[Simulation] = None
+
+def _init_worker(tax_config: TaxConfig) -> None:
+    global _worker_sim
+    _worker_sim = Simulation(tax_config)
+
+def _run_chunk(chunk: List[Tuple[int, Dict[str, Any]]], withdrawal_rate: float, defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+    rows = []
+    for index, raw in chunk:
+        row = {'id': str(raw.get('id', index)), 'error': ''}
+        try:
+            scenario_id, person, options = parse_scenario({**defaults, **{k: v for k, v in raw.items() if v not in (None, '')}}, index)
+            row.update(id=scenario_id, **summarize(_worker_sim, person, options['years'], options['inflation'], withdrawal_rate))
+        except Exception as exc:  # one bad profile must not stop a nightly run
+            row['error'] = f"{type(exc).__name__}: {exc}"
+        rows.append(row)
+    return rows
+
+class _CsvSink:
+    def __init__(self, path: Optional[str]):
+        self._file = sys.stdout if path in (None, '-') else open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=RESULT_COLUMNS)
+        self._writer.writeheader()
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.writerows(rows)
+        self._file.flush()
+    def close(self) -> None:
+        if self._file is not sys.stdout:
+            self._file.close()
+
+class _ParquetSink:
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Parquet output needs pyarrow, from the parquet extra: pip install 'fire-simulator[parquet]'") from exc
+        self._pa = pa
+        self._schema = pa.schema([(c, pa.string()) if c in ('id', 'name', 'error') else (c, pa.int32()) if c in ('years', 'years_to_fire') else (c, pa.float64())
+                                  for c in RESULT_COLUMNS])
+        self._writer = pq.ParquetWriter(path, self._schema)
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+    def close(self) -> None:
+        self._writer.close()
+
+def run_batch(scenarios: Iterable[Dict[str, Any]], output: Optional[str] = None, fmt: str = 'csv', workers: Optional[int] = None,
+              tax_config: Optional[TaxConfig] = None, withdrawal_rate: float = 0.04, chunk_size: int = 64,
+              defaults: Optional[Dict[str, Any]] = None) -> int:
+    """Project every scenario and stream summary rows to output; returns the number of rows written."""
+    sink = _ParquetSink(output) if fmt == 'parquet' else _CsvSink(output)
+    tax_config = tax_config or TaxConfig()
+    defaults = defaults or {}
+    chunks = _chunks(enumerate(scenarios), chunk_size)
+    written = 0
+    try:
+        if workers == 1:
+            _init_worker(tax_config)
+            for chunk in chunks:
+                rows = _run_chunk(chunk, withdrawal_rate, defaults)
+                sink.write(rows)
+                written += len(rows)
+            return written
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tax_config,)) as pool:
+            # keep a bounded number of chunks in flight so the input is never fully materialised
+            limit = 2 * workers
+            pending = set()
+            for chunk in chunks:
+                pending.add(pool.submit(_run_chunk, chunk, withdrawal_rate, defaults))
+                if len(pending) >= limit:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rows = future.result()
+                        sink.write(rows)
+                        written += len(rows)
+            for future in wait(pending).done:
+                rows = future.result()
+                sink.write(rows)
+                written += len(rows)
+        return written
+    finally:
+        sink.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m finance', description='Project FIRE scenarios in batch and stream one summary row per scenario.')
+    parser.add_argument('input', help='scenario file (.yaml, .json, .jsonl or .csv)')
+    parser.add_argument('-o', '--output', default='-', help='output file, "-" for stdout (CSV only)')
+    parser.add_argument('-f', '--format', choices=('csv', 'parquet'), help='output format (default from the output extension)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: all cores, 1 = in-process)')
+    parser.add_argument('--years', type=int, help='default projection years for scenarios without "years"')
+    parser.add_argument('--inflation', type=float, help='default inflation for scenarios without "inflation"')
+    parser.add_argument('--withdrawal-rate', type=float, default=0.04)
+    parser.add_argument('--tax-config', help='YAML/JSON tax table with every TaxConfig field')
+    parser.add_argument('--tax-year', type=int, help='use the shipped tax table in force in this year (default: the latest)')
+    parser.add_argument('--jurisdiction', default='NO', help='jurisdiction of the shipped tax tables')
+    parser.add_argument('--chunk-size', type=int, default=64)
+    args = parser.parse_args(argv)
+    fmt = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    if fmt == 'parquet' and args.output == '-':
+        parser.error('parquet output needs a file path')
+    tax_config = config_from_file(args.tax_config) if args.tax_config else tax_config_for(args.jurisdiction, args.tax_year)
+    defaults = {k: v for k, v in (('years', args.years), ('inflation', args.inflation)) if v is not None}
+    count = run_batch(read_scenarios(args.input), args.output, fmt, args.workers, tax_config, args.withdrawal_rate, args.chunk_size, defaults)
+    print(f'{count} scenarios written', file=sys.stderr)
+    return 0
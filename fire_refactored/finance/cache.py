@@ -0,0 +1,116 @@
+"""Content-addressed cache for simulation results.
+
+Keys are a SHA-256 over a canonical JSON form of the inputs (dataclasses, numbers, arrays),
+so equal Person/Loan/Investment/TaxConfig values hit the same entry regardless of identity.
+Inputs without a value form, such as callable paths, raise TypeError and are not cached.
+"""
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, Dict, Optional
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import threading
+import numpy as np
+
+def _canonical(obj: Any) -> Any:
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return {'__type__': type(obj).__name__, **{f.name: _canonical(getattr(obj, f.name)) for f in fields(obj)}}
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        data = np.ascontiguousarray(obj, dtype=float)
+        return {'__ndarray__': list(data.shape), 'sha256': hashlib.sha256(data.tobytes()).hexdigest()}
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if obj is None or isinstance(obj, (bool, str)):
+        return obj
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, (int, float, np.integer, np.floating)):
+        # 20 and 20.0 describe the same input
+        return float(obj)
+    if hasattr(obj, '__array__') and not callable(obj):
+        return _canonical(np.asarray(obj))
+    # a repr (e.g. of a callable) names an object, not its value, and memory addresses are reused
+    raise TypeError(f"Cannot hash {type(obj).__name__} by value")
+
+def stable_hash(*parts: Any) -> str:
+    """SHA-256 of the parts' values; raises TypeError for inputs without a value form, such as callables."""
+    payload = json.dumps(_canonical(parts), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _nbytes(value: Any) -> int:
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(deep=True).sum())
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by entry size in bytes, optionally persisted to a directory."""
+    def __init__(self, max_bytes: int = 256 * 2**20, path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + '.pkl')
+    def _store(self, key: str, value: Any) -> None:
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.nbytes -= self._sizes[key]
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._sizes[key] = size
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            old, _ = self._entries.popitem(last=False)
+            self.nbytes -= self._sizes.pop(old)
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            if self.path and os.path.exists(self._file(key)):
+                with open(self._file(key), 'rb') as f:
+                    value = pickle.load(f)
+                self._store(key, value)
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+            if self.path:
+                tmp = self._file(key) + f'.{os.getpid()}.tmp'
+                with open(tmp, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, self._file(key))
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+            self.hits = self.misses = 0
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self.nbytes}
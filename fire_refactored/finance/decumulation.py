@@ -0,0 +1,175 @@
+"""Retirement-phase (drawdown) simulation across Monte Carlo return paths.
+
+Each year a gross withdrawal is taken from the brokerage, ASK and IPS balances at the start of
+the year, taxed, and the remaining balances grow with that year's drawn returns. Brokerage sales
+are taxed on the average-cost gain, ASK withdrawals are tax-free up to the remaining deposits,
+and IPS payouts are taxed as ordinary income. Wealth tax is charged on the balance left after
+the withdrawal. All paths (and any batch of candidate rates) are evolved together; the only
+Python loop is over years. safe_withdrawal_rate bisects its rate grid on shared return paths.
+"""
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from .models import Person, as_series
+from .tax import TaxConfig, TaxEngine
+from .simulation import ACCOUNT_TYPES, _Holdings, _holdings, _account_totals, _draw_growth, _deflator
+
+STRATEGIES = ('fixed_percent', 'fixed_real', 'guardrails')
+
+@dataclass
+class WithdrawalStrategy:
+    kind: str = 'fixed_real'
+    rate: float = 0.04
+    amount: Optional[float] = None
+    guardrail_band: float = 0.2
+    guardrail_adjustment: float = 0.1
+    order: Tuple[str, ...] = ('ASK', 'brokerage', 'IPS')
+    tax_optimal: bool = False
+    def __post_init__(self):
+        if self.kind not in STRATEGIES:
+            raise ValueError(f"Unknown withdrawal strategy {self.kind!r}, expected one of {STRATEGIES}")
+        if sorted(self.order) != sorted(ACCOUNT_TYPES):
+            raise ValueError(f"order must be a permutation of {ACCOUNT_TYPES}")
+
+def _tax_cost(engine: TaxEngine, balance: np.ndarray, basis: np.ndarray, amount: np.ndarray) -> np.ndarray:
+    # tax per krone withdrawn from each account if the whole amount came from it
+    cg = engine.cfg.capital_gains_tax_rate
+    with np.errstate(divide='ignore', invalid='ignore'):
+        brokerage = cg * np.clip(1 - basis[..., 0] / balance[..., 0], 0.0, 1.0)
+        ask = cg * np.clip(1 - basis[..., 1] / amount, 0.0, 1.0)
+        ips = np.where(amount > 0, engine.income_tax(amount) / amount, 0.0)
+    return np.nan_to_num(np.stack([brokerage, ask, ips], axis=-1))
+
+def _withdraw(balance: np.ndarray, amount: np.ndarray, order: np.ndarray) -> np.ndarray:
+    # fill amount from accounts in the given order: (3,) for every path, or per path
+    ordered = balance[..., order] if order.ndim == 1 else np.take_along_axis(balance, order, axis=-1)
+    before = np.cumsum(ordered, axis=-1) - ordered
+    taken = np.clip(amount[..., None] - before, 0.0, ordered)
+    out = np.empty_like(taken)
+    if order.ndim == 1:
+        out[..., order] = taken
+    else:
+        np.put_along_axis(out, order, taken, axis=-1)
+    return out
+
+def _drawdown(growth: np.ndarray, holdings: _Holdings, basis: np.ndarray, strategy: WithdrawalStrategy, rate: np.ndarray,
+              engine: TaxEngine, inflation) -> Dict[str, np.ndarray]:
+    """Evolve holdings of shape rate.shape + (n_paths, n_holdings) through growth of shape (n_paths, years, n_holdings).
+
+    Withdrawals are decided per account and taken pro rata from the holdings in that account.
+    """
+    n_paths, years, _ = growth.shape
+    inflation = np.broadcast_to(as_series(inflation, years), (years,))
+    shape = rate.shape + (n_paths,)
+    held = np.broadcast_to(holdings.principal, shape + (len(holdings.principal),)).copy()
+    # account totals as one small matmul per year
+    to_account = np.eye(len(ACCOUNT_TYPES))[holdings.account]
+    balance = held @ to_account
+    basis = np.broadcast_to(basis, shape + (3,)).copy()
+    rate = rate[..., None]
+    initial = balance.sum(axis=-1)
+    withdrawal = rate * initial if strategy.amount is None else np.full(shape, float(strategy.amount))
+    fixed_order = np.array([ACCOUNT_TYPES.index(a) for a in strategy.order])
+    alive = np.ones(shape, dtype=bool)
+    out = {k: np.empty(shape + (years,)) for k in ('portfolio', 'withdrawal', 'tax', 'spending')}
+    out['alive'] = np.empty(shape + (years,), dtype=bool)
+    for y in range(years):
+        total = balance.sum(axis=-1)
+        if strategy.kind == 'fixed_percent':
+            withdrawal = rate * total
+        elif y > 0:
+            withdrawal = withdrawal * (1 + inflation[y])
+            if strategy.kind == 'guardrails':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    current = withdrawal / total
+                withdrawal = np.where(current > rate * (1 + strategy.guardrail_band), withdrawal * (1 - strategy.guardrail_adjustment),
+                             np.where(current < rate * (1 - strategy.guardrail_band), withdrawal * (1 + strategy.guardrail_adjustment), withdrawal))
+        alive &= total >= withdrawal
+        order = np.argsort(_tax_cost(engine, balance, basis, withdrawal), axis=-1, kind='stable') if strategy.tax_optimal else fixed_order
+        taken = _withdraw(balance, withdrawal, order)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sold_basis = np.where(balance[..., 0] > 0, taken[..., 0] * basis[..., 0] / balance[..., 0], 0.0)
+        ask_free = np.minimum(taken[..., 1], basis[..., 1])
+        basis[..., 0] -= sold_basis
+        basis[..., 1] -= ask_free
+        with np.errstate(divide='ignore', invalid='ignore'):
+            held *= np.where(balance > 0, 1 - taken / balance, 0.0)[..., holdings.account]
+        tax = (engine.capital_gains_tax(taken[..., 0] - sold_basis) + engine.capital_gains_tax(taken[..., 1] - ask_free)
+               + engine.income_tax(taken[..., 2]) + engine.wealth_tax((balance - taken).sum(axis=-1)))
+        held *= growth[:, y]
+        balance = held @ to_account
+        drawn = taken.sum(axis=-1)
+        out['portfolio'][..., y] = balance.sum(axis=-1)
+        out['withdrawal'][..., y] = drawn
+        out['tax'][..., y] = tax
+        out['spending'][..., y] = np.where(alive, drawn - tax, 0.0)
+        out['alive'][..., y] = alive
+    return out
+
+def _inputs(person: Person, balances: Optional[Dict[str, float]], basis: Optional[Dict[str, float]]):
+    holdings = _holdings(person)
+    if balances is not None:
+        # idle holdings for accounts given a balance but no investment, then rescale each account
+        missing = [i for i, a in enumerate(ACCOUNT_TYPES) if balances.get(a, 0.0) > 0 and not (holdings.account == i).any()]
+        pad = lambda values, fill: np.concatenate([values, np.full(len(missing), fill)])
+        holdings = replace(holdings, principal=pad(holdings.principal, 1.0), annual_return=pad(holdings.annual_return, 0.0),
+                           annual_volatility=pad(holdings.annual_volatility, 0.0), account=np.concatenate([holdings.account, missing]).astype(int),
+                           weight=pad(holdings.weight, 0.0))
+        current = _account_totals(holdings.principal, holdings.account)
+        counts = np.bincount(holdings.account, minlength=len(ACCOUNT_TYPES))
+        wanted = np.array([balances.get(a, 0.0) for a in ACCOUNT_TYPES], dtype=float)
+        share = np.where(current[holdings.account] > 0, holdings.principal / np.where(current > 0, current, 1.0)[holdings.account], 1.0 / counts[holdings.account])
+        holdings = replace(holdings, principal=share * wanted[holdings.account])
+    start = _account_totals(holdings.principal, holdings.account)
+    cost = start.copy() if basis is None else np.array([basis.get(a, 0.0) for a in ACCOUNT_TYPES], dtype=float)
+    return holdings, cost
+
+def simulate_withdrawals(person: Person, strategy: WithdrawalStrategy = None, years: int = 30, n_paths: int = 10_000,
+                         seed: Optional[int] = None, inflation: float = 0.02, tax_config: Optional[TaxConfig] = None,
+                         balances: Optional[Dict[str, float]] = None, basis: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Draw down the portfolio over n_paths return paths.
+
+    balances/basis map account type to starting balance and cost basis (ASK: deposits); they
+    default to the person's investments with no embedded gain. A path fails in the first year
+    its balance cannot cover the withdrawal. inflation may be a per-year path.
+    """
+    strategy = strategy or WithdrawalStrategy()
+    holdings, cost = _inputs(person, balances, basis)
+    res = _drawdown(_draw_growth(holdings, years, n_paths, seed), holdings, cost, strategy, np.asarray(strategy.rate, dtype=float),
+                    TaxEngine(tax_config or TaxConfig()), inflation)
+    deflator = _deflator(inflation, years)
+    real = np.percentile(res['portfolio'] / deflator, [5, 50, 95], axis=0)
+    bands = pd.DataFrame({
+        'year': np.arange(1, years+1),
+        'real_portfolio_p5': real[0], 'real_portfolio_p50': real[1], 'real_portfolio_p95': real[2],
+        'withdrawal_p50': np.median(res['withdrawal'], axis=0),
+        'tax_p50': np.median(res['tax'], axis=0),
+        'real_spending_p50': np.median(res['spending'], axis=0) / deflator,
+        'survival_probability': res['alive'].mean(axis=0)
+    })
+    return {'bands': bands, 'failure_probability': float(1 - res['alive'][:, -1].mean()) if years else 0.0, 'n_paths': n_paths}
+
+def safe_withdrawal_rate(person: Person, years: int = 30, n_paths: int = 10_000, seed: Optional[int] = None,
+                         inflation: float = 0.02, success: float = 0.95, rates=None, tax_config: Optional[TaxConfig] = None,
+                         strategy: WithdrawalStrategy = None, balances: Optional[Dict[str, float]] = None,
+                         basis: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Highest rate of the grid whose success probability is at least `success`.
+
+    Every candidate runs on the same return paths, where success falls as the rate rises, so the
+    grid is bisected: about log2(len(rates)) passes. table holds the evaluated rates.
+    """
+    strategy = strategy or WithdrawalStrategy()
+    rates = np.arange(0.02, 0.0801, 0.0025) if rates is None else np.unique(np.asarray(rates, dtype=float))
+    holdings, cost = _inputs(person, balances, basis)
+    growth = _draw_growth(holdings, years, n_paths, seed)
+    engine = TaxEngine(tax_config or TaxConfig())
+    tried = {}
+    lo, hi = -1, len(rates)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        res = _drawdown(growth, holdings, cost, strategy, rates[mid:mid+1], engine, inflation)
+        tried[mid] = float(res['alive'][0, :, -1].mean()) if years else 1.0
+        lo, hi = (mid, hi) if tried[mid] >= success else (lo, mid)
+    table = pd.DataFrame({'rate': rates[sorted(tried)], 'success_probability': [tried[i] for i in sorted(tried)]})
+    return {'safe_withdrawal_rate': float(rates[lo]) if lo >= 0 else float('nan'), 'table': table}
@@ -0,0 +1,146 @@
+"""Columnar export of projections, amortization schedules and Monte Carlo bands.
+
+Each kind of table is a Parquet dataset under root/<kind>/ partitioned by scenario
+(root/<kind>/scenario=<id>/part-*.parquet), so a scenario can be appended to or replaced without
+touching the others. Money columns are float64, or float32 when asked for; counters are int32.
+Reads memory-map the files. Excel is only offered as a small summary of already computed frames.
+"""
+from typing import Dict, List, Optional, Sequence, Union
+from urllib.parse import quote
+import io
+import os
+import re
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+from .models import Loan
+from .loans import amortize
+
+KINDS = ('projection', 'amortization', 'monte_carlo')
+FLOAT_DTYPES = ('float32', 'float64')
+INT_COLUMNS = ('year', 'month', 'percentile')
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("Parquet export needs pyarrow, from the parquet extra: pip install 'fire-simulator[parquet]'") from exc
+    return pa, pq
+
+def to_arrow(df: pd.DataFrame, float_dtype: str = 'float64'):
+    """Arrow table with int32 counters and float columns cast to float_dtype."""
+    if float_dtype not in FLOAT_DTYPES:
+        raise ValueError(f"float_dtype must be one of {FLOAT_DTYPES}")
+    pa, _ = _pyarrow()
+    floating = pa.float32() if float_dtype == 'float32' else pa.float64()
+    arrays = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if name in INT_COLUMNS:
+            arrays[name] = pa.array(values, type=pa.int32())
+        elif np.issubdtype(values.dtype, np.floating):
+            arrays[name] = pa.array(values, type=floating)
+        else:
+            arrays[name] = pa.array(values, from_pandas=True)
+    return pa.table(arrays)
+
+def _partition(root: str, kind: str, scenario) -> str:
+    if kind not in KINDS:
+        raise ValueError(f"Unknown table kind {kind!r}, expected one of {KINDS}")
+    if str(scenario) == '':
+        raise ValueError("scenario must be a non-empty id")
+    return os.path.join(root, kind, f'scenario={quote(str(scenario), safe="")}')
+
+def write_table(df: pd.DataFrame, root: str, kind: str, scenario, append: bool = False, float_dtype: str = 'float64') -> str:
+    """Write df as a new part of scenario's partition; without append the partition is replaced.
+
+    Returns the path of the part file written.
+    """
+    _, pq = _pyarrow()
+    table = to_arrow(df, float_dtype)
+    directory = _partition(root, kind, scenario)
+    if not append and os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'part-{uuid.uuid4().hex}.parquet')
+    pq.write_table(table, path)
+    return path
+
+def export_projection(df: pd.DataFrame, root: str, scenario, append: bool = False, float_dtype: str = 'float64') -> str:
+    """Write a project_yearly / project_monthly frame."""
+    return write_table(df, root, 'projection', scenario, append, float_dtype)
+
+def amortization_frame(loans: Union[Loan, Sequence[Loan]]) -> pd.DataFrame:
+    """Monthly schedules of one or more loans stacked, with a 'loan' column (name or position)."""
+    loans = [loans] if isinstance(loans, Loan) else list(loans)
+    frames = []
+    for i, loan in enumerate(loans):
+        s = amortize(loan)
+        frames.append(pd.DataFrame({'loan': loan.name or str(i), 'month': np.arange(1, s.months()+1), 'payment': s.payment,
+                                    'interest': s.interest, 'principal': s.principal, 'balance': s.balance}))
+    if not frames:
+        return pd.DataFrame({'loan': pd.Series(dtype=object), 'month': pd.Series(dtype=int),
+                             **{k: pd.Series(dtype=float) for k in ('payment', 'interest', 'principal', 'balance')}})
+    return pd.concat(frames, ignore_index=True)
+
+def export_amortization(loans: Union[Loan, Sequence[Loan]], root: str, scenario, append: bool = False, float_dtype: str = 'float64') -> str:
+    return write_table(amortization_frame(loans), root, 'amortization', scenario, append, float_dtype)
+
+def percentile_cube(bands: pd.DataFrame) -> pd.DataFrame:
+    """Reshape wide '<metric>_p<q>' band columns into rows of (year, percentile) with one column per metric.
+
+    Columns without a percentile suffix (e.g. fire_probability) are repeated on every percentile row.
+    """
+    pattern = re.compile(r'^(.+)_p(\d+)$')
+    banded = {c: pattern.match(c).groups() for c in bands.columns if pattern.match(c)}
+    other = [c for c in bands.columns if c not in banded and c != 'year']
+    percentiles = sorted({int(q) for _, q in banded.values()})
+    metrics = list(dict.fromkeys(m for m, _ in banded.values()))
+    n = len(bands)
+    out = {'year': np.tile(bands['year'].to_numpy(), len(percentiles)), 'percentile': np.repeat(percentiles, n)}
+    for metric in metrics:
+        out[metric] = np.concatenate([bands[f'{metric}_p{q}'].to_numpy(dtype=float) if f'{metric}_p{q}' in bands else np.full(n, np.nan)
+                                      for q in percentiles])
+    for c in other:
+        out[c] = np.tile(bands[c].to_numpy(), len(percentiles))
+    return pd.DataFrame(out)
+
+def export_monte_carlo(result: Dict, root: str, scenario, append: bool = False, float_dtype: str = 'float64') -> str:
+    """Write the bands of project_monte_carlo / simulate_withdrawals as a percentile cube."""
+    return write_table(percentile_cube(result['bands']), root, 'monte_carlo', scenario, append, float_dtype)
+
+def read_table(root: str, kind: str, scenario=None, columns: Optional[List[str]] = None):
+    """Memory-mapped read of one kind, optionally a single scenario; returns a pyarrow Table."""
+    pa, pq = _pyarrow()
+    import pyarrow.dataset as ds
+    if kind not in KINDS:
+        raise ValueError(f"Unknown table kind {kind!r}, expected one of {KINDS}")
+    directory = os.path.join(root, kind)
+    key = pa.schema([('scenario', pa.string())])
+    # partitions may mix float32 and float64 parts; read them all at the wider type
+    parts = ds.dataset(directory, format='parquet').files
+    schema = pa.unify_schemas([pq.read_schema(f, memory_map=True) for f in parts] + [key], promote_options='permissive')
+    filters = None if scenario is None else [('scenario', '=', str(scenario))]
+    return pq.read_table(directory, columns=columns, filters=filters, schema=schema, partitioning=ds.partitioning(key, flavor='hive'), memory_map=True)
+
+def read_frame(root: str, kind: str, scenario=None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    return read_table(root, kind, scenario, columns).to_pandas()
+
+def to_parquet_bytes(df: pd.DataFrame, float_dtype: str = 'float64') -> bytes:
+    _, pq = _pyarrow()
+    buffer = io.BytesIO()
+    pq.write_table(to_arrow(df, float_dtype), buffer)
+    return buffer.getvalue()
+
+def excel_summary(frames: Dict[str, pd.DataFrame], max_rows: int = 1000) -> bytes:
+    """Small multi-sheet Excel view (one sheet per frame); large outputs belong in Parquet."""
+    too_long = [name for name, df in frames.items() if len(df) > max_rows]
+    if too_long:
+        raise ValueError(f"Frames too large for an Excel summary (> {max_rows} rows): {too_long}; export them to Parquet")
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        for name, df in frames.items():
+            df.to_excel(writer, sheet_name=name[:31], index=False)
+    return buffer.getvalue()
@@ -0,0 +1,38 @@
+"""Annual market history for backtests, stored as a compact .npz file.
+
+The file holds an int 'year' array and equal-length float arrays 'equity', 'bond' and 'cpi'
+(annual total returns and inflation as decimals). The package ships no history: build a file
+once from a CSV with history_from_csv and read it with load_history, both at a path you choose,
+without any network access.
+"""
+from typing import Dict
+import os
+import numpy as np
+import pandas as pd
+
+SERIES = ('equity', 'bond', 'cpi')
+
+def save_history(path: str, year, equity, bond, cpi) -> None:
+    arrays = {'year': np.asarray(year, dtype=np.int32), 'equity': equity, 'bond': bond, 'cpi': cpi}
+    arrays.update({k: np.asarray(arrays[k], dtype=float) for k in SERIES})
+    if len({len(v) for v in arrays.values()}) != 1:
+        raise ValueError("year, equity, bond and cpi must have the same length")
+    if np.any(np.diff(arrays['year']) != 1):
+        raise ValueError("history years must be consecutive")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(path, **arrays)
+
+def load_history(path: str) -> Dict[str, np.ndarray]:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No history file at {path}; no history is bundled, so build one from a CSV "
+                                f"with columns year,equity,bond,cpi using history_from_csv(csv_path, {path!r})")
+    with np.load(path) as data:
+        return {k: data[k] for k in ('year',) + SERIES}
+
+def history_from_csv(csv_path: str, path: str) -> None:
+    """Convert a CSV with columns year, equity, bond, cpi into a history file at path."""
+    df = pd.read_csv(csv_path)
+    missing = {'year', *SERIES} - set(df.columns)
+    if missing:
+        raise ValueError(f"History CSV is missing columns: {sorted(missing)}")
+    save_history(path, **{k: df[k].to_numpy() for k in ('year',) + SERIES})
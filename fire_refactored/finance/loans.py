@@ -1,5 +1,7 @@
-from typing import List, Dict
-from .models import Loan
+from dataclasses import dataclass
+from typing import List, Dict, Sequence
+import numpy as np
+from .models import Loan, as_series
 
 def annuity_payment(principal: float, annual_rate: float, years: int) -> float:
     if annual_rate == 0 or years == 0:
@@ -9,15 +11,227 @@ def annuity_payment(principal: float, annual_rate: float, years: int) -> float:
     payment = principal * (r * (1+r)**n) / ((1+r)**n - 1)
     return payment
 
+@dataclass(frozen=True)
+class AmortizationSchedule:
+    """Monthly loan schedule as arrays; element k is month k (0-based)."""
+    payment: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+    balance: np.ndarray
+    def months(self) -> int:
+        return len(self.balance)
+    def balance_at(self, months: np.ndarray) -> np.ndarray:
+        """Outstanding balance after the given number of paid months (0 = original principal)."""
+        months = np.asarray(months)
+        padded = np.concatenate([[self.balance[0] + self.principal[0]], self.balance, [0.0]])
+        return padded[np.clip(months, 0, self.months() + 1)]
+    def yearly_balance(self, years: int) -> np.ndarray:
+        """Balance at the end of years 1..years, zero after payoff."""
+        return self.balance_at(12 * np.arange(1, years+1))
+    def padded(self, field: str, months: int) -> np.ndarray:
+        """Monthly payment/interest/principal column over months 1..months, zero after payoff."""
+        out = np.zeros(months)
+        n = min(months, self.months())
+        out[:n] = getattr(self, field)[:n]
+        return out
+    def to_records(self) -> List[Dict]:
+        return [{'month': m, 'payment': self.payment[m], 'interest': self.interest[m], 'principal': self.principal[m], 'balance': self.balance[m]}
+                for m in range(self.months())]
+
+def _is_scalar(value) -> bool:
+    # cheaper than np.ndim for the plain-number fields of a Loan
+    return isinstance(value, (int, float, np.number))
+
+def _annuity(balance, monthly_rate, months):
+    # works elementwise on arrays; a zero rate or no months left repays the balance evenly
+    if _is_scalar(balance) and _is_scalar(monthly_rate) and _is_scalar(months):
+        months = max(int(months), 1)
+        if monthly_rate == 0:
+            return float(balance) / months
+        growth = (1 + monthly_rate) ** months
+        return float(balance * monthly_rate * growth / (growth - 1))
+    months = np.maximum(months, 1)
+    rate = np.where(monthly_rate == 0, 1.0, monthly_rate)
+    growth = (1 + rate) ** months
+    payment = np.where(monthly_rate == 0, balance / months, balance * rate * growth / (growth - 1))
+    return payment if payment.ndim else float(payment)
+
+@dataclass(frozen=True)
+class ScheduleBatch:
+    """Monthly schedules of several loans as (n_loans, months) arrays, zero after each loan's payoff.
+
+    length holds each loan's number of months until payoff.
+    """
+    payment: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+    balance: np.ndarray
+    length: np.ndarray
+    def __len__(self) -> int:
+        return len(self.length)
+    def schedule(self, i: int) -> AmortizationSchedule:
+        n = int(self.length[i])
+        return AmortizationSchedule(payment=self.payment[i, :n], interest=self.interest[i, :n], principal=self.principal[i, :n], balance=self.balance[i, :n])
+    def yearly_balance(self, years: int) -> np.ndarray:
+        """(n_loans, years) balance at the end of years 1..years, zero after payoff."""
+        padded = np.concatenate([self.balance, np.zeros((len(self), 1))], axis=1)
+        return padded[:, np.minimum(12 * np.arange(1, years+1), padded.shape[1]) - 1]
+    def padded(self, field: str, months: int) -> np.ndarray:
+        """(n_loans, months) payment/interest/principal/balance over months 1..months, zero after payoff."""
+        out = np.zeros((len(self), months))
+        n = min(months, self.balance.shape[1])
+        out[:, :n] = getattr(self, field)[:, :n]
+        return out
+
+def _fill_loan(loan: Loan, rates: np.ndarray, extra: np.ndarray, paying: np.ndarray) -> None:
+    # writes one loan's monthly rates, extra payments and paying flags into its zeroed rows;
+    # payment holidays extend the term, months past it keep the last rate and extra payment
+    n = loan.months() + len(set(loan.payment_holidays))
+    for month in loan.payment_holidays:
+        if not 1 <= int(month) <= n:
+            raise ValueError(f"payment_holidays months must be within 1..{n}, got {month}")
+        paying[int(month) - 1] = True
+    paying[:n] = ~paying[:n]
+    m = loan.months()
+    rates[:m] = loan.monthly_rates()
+    rates[m:n] = rates[m-1]
+    if np.ndim(loan.extra_payment) or loan.extra_payment:
+        extra[:m] = as_series(loan.extra_payment, loan.years, monthly=True)
+        extra[m:n] = extra[m-1]
+    for month, amount in loan.one_off_payments.items():
+        if not 1 <= int(month) <= n:
+            raise ValueError(f"one_off_payments months must be within 1..{n}, got {month}")
+        extra[int(month) - 1] += amount
+
+def _is_plain(loan: Loan) -> bool:
+    return loan.kind == 'annuity' and _is_scalar(loan.extra_payment) and not loan.one_off_payments and not loan.payment_holidays
+
+def _amortize_plain(loan: Loan) -> AmortizationSchedule:
+    # annuity with a constant extra payment: one closed-form stretch per rate, no batch overhead
+    n = loan.months()
+    if _is_scalar(loan.annual_rate):
+        # a fixed rate is one stretch from month 0, without a per-month rate array
+        rates = r = loan.annual_rate / 12.0
+        payment = _annuity(loan.principal, r, n) + loan.extra_payment
+        k = np.arange(n+1)
+        if r == 0:
+            balance = loan.principal - payment * k
+        else:
+            growth = (1 + r) ** k
+            balance = loan.principal * growth - payment * (growth - 1) / r
+    else:
+        rates = loan.monthly_rates()
+        starts = [0, *(np.flatnonzero(rates[1:] != rates[:-1]) + 1).tolist()]
+        balance = np.zeros(n+1)
+        balance[0] = loan.principal
+        for s, e in zip(starts, starts[1:] + [n]):
+            if balance[s] <= 0:
+                break
+            r = rates[s]
+            payment = _annuity(balance[s], r, n - s) + loan.extra_payment
+            k = np.arange(1, e - s + 1)
+            if r == 0:
+                balance[s+1:e+1] = balance[s] - payment * k
+            else:
+                growth = (1 + r) ** k
+                balance[s+1:e+1] = balance[s] * growth - payment * (growth - 1) / r
+        rates = rates[:n]
+    balance = np.maximum(balance, 0.0)
+    paid_off = np.flatnonzero(balance[1:] <= 1e-9 * max(loan.principal, 1.0))
+    if len(paid_off):
+        balance = balance[:paid_off[0]+2]
+        balance[-1] = 0.0
+        if np.ndim(rates):
+            rates = rates[:len(balance)-1]
+    interest = balance[:-1] * rates
+    principal = balance[:-1] - balance[1:]
+    return AmortizationSchedule(payment=principal + interest, interest=interest, principal=principal, balance=balance[1:])
+
+def _pack(schedules: Sequence[AmortizationSchedule], months: int) -> ScheduleBatch:
+    length = np.array([one.months() for one in schedules])
+    out = np.zeros((4, len(schedules), months))
+    for i, one in enumerate(schedules):
+        out[:, i, :length[i]] = (one.payment, one.interest, one.principal, one.balance)
+    return ScheduleBatch(payment=out[0], interest=out[1], principal=out[2], balance=out[3], length=length)
+
+def amortize_many(loans: Sequence[Loan]) -> ScheduleBatch:
+    """Schedules of many loans at once, e.g. one loan under a grid of extra payments.
+
+    Plain annuities (see _is_plain) take their closed form one by one, which beats the batch
+    recurrence at every size measured; any other loan sends the whole batch through amortize_arrays.
+    """
+    if all(_is_plain(loan) for loan in loans):
+        return _pack([_amortize_plain(loan) for loan in loans], max(loan.months() for loan in loans))
+    width = max(loan.months() + len(set(loan.payment_holidays)) for loan in loans)
+    rates, extra = np.zeros((2, len(loans), width))
+    paying = np.zeros((len(loans), width), dtype=bool)
+    for i, loan in enumerate(loans):
+        _fill_loan(loan, rates[i], extra[i], paying[i])
+    return amortize_arrays(np.array([loan.principal for loan in loans], dtype=float), rates, extra, paying,
+                           np.array([loan.kind == 'serial' for loan in loans]))
+
+def amortize_arrays(principal: np.ndarray, rates: np.ndarray, extra: np.ndarray, paying: np.ndarray, serial: np.ndarray) -> ScheduleBatch:
+    """Batched schedules from (n_loans, months) monthly rates, extra payments and paying flags.
+
+    Every loan follows B_{k+1} = g_k B_k - c_k with c_k = A paying_k + extra_k. For an annuity
+    month g_k = 1 + r_k and the interest is inside A; a serial month or a payment holiday pays its
+    interest separately, so g_k = 1 (holidays pay interest only). With G the cumulative product of g,
+    B_k = G_k (B_s / G_s - sum_{s<=m<k} c_m / G_{m+1}) from the start s of each stretch with a constant A.
+    A is an annuity over the remaining paying months, re-computed whenever the rate changes, or the
+    fixed serial installment principal / paying months. Months past a loan's term pay nothing.
+    """
+    principal, serial = np.asarray(principal, dtype=float), np.asarray(serial, dtype=bool)
+    rates, extra, paying = np.asarray(rates, dtype=float), np.asarray(extra, dtype=float), np.asarray(paying, dtype=bool)
+    n_loans, months = rates.shape
+    growth = np.ones((n_loans, months+1))
+    plain = paying.all() and not serial.any()
+    np.cumprod(1 + rates if plain else np.where(serial[:, None] | ~paying, 1.0, 1 + rates), axis=1, out=growth[:, 1:])
+    # c_m / G_{m+1} summed from month 0; the constant-A part and the extra part separately
+    paid = np.zeros((n_loans, months+1))
+    np.cumsum(1 / growth[:, 1:] if plain else paying / growth[:, 1:], axis=1, out=paid[:, 1:])
+    extras = 0.0
+    if extra.any():
+        extras = np.zeros((n_loans, months+1))
+        np.cumsum(extra / growth[:, 1:], axis=1, out=extras[:, 1:])
+    if plain:
+        paying_before = np.broadcast_to(np.arange(months+1.0), (n_loans, months+1))
+    else:
+        paying_before = np.zeros((n_loans, months+1))
+        np.cumsum(paying, axis=1, out=paying_before[:, 1:])
+    change = (rates[:, 1:] != rates[:, :-1]) & ~serial[:, None]
+    rows = np.arange(n_loans)
+    balance = np.empty((n_loans, months+1))
+    balance[:, 0] = principal
+    installment = principal / np.maximum(paying_before[:, -1], 1)
+    segment = np.concatenate([np.zeros((n_loans, 1), dtype=int), np.cumsum(change, axis=1)], axis=1) if change.any() else None
+    for j in range(1 if segment is None else int(segment[:, -1].max()) + 1):
+        s = np.zeros(n_loans, dtype=int) if segment is None else (segment == j).argmax(axis=1)
+        start = balance[rows, s]
+        payment = np.where(serial, installment, _annuity(start, rates[rows, s], paying_before[:, -1] - paying_before[rows, s]))
+        values = (start / growth[rows, s] + payment * paid[rows, s])[:, None] - payment[:, None] * paid[:, 1:]
+        if np.ndim(extras):
+            values -= extras[:, 1:] - extras[rows, s][:, None]
+        values *= growth[:, 1:]
+        if segment is None:
+            balance[:, 1:] = values
+        else:
+            inside = segment == j
+            balance[:, 1:][inside] = values[inside]
+    # a loan is done at its first (numerically) non-positive balance; nothing is owed or paid after that
+    done = balance[:, 1:] <= 1e-9 * np.maximum(principal, 1.0)[:, None]
+    length = np.where(done.any(axis=1), done.argmax(axis=1) + 1, months)
+    live = np.arange(months) < length[:, None]
+    balance[:, 1:][done] = 0.0
+    balance[:, 1:] *= live
+    interest = balance[:, :-1] * rates
+    interest *= live
+    repaid = balance[:, :-1] - balance[:, 1:]
+    repaid *= live
+    return ScheduleBatch(payment=repaid + interest, interest=interest, principal=repaid, balance=balance[:, 1:], length=length)
+
+def amortize(loan: Loan) -> AmortizationSchedule:
+    """Monthly schedule of one loan (see amortize_arrays)."""
+    return _amortize_plain(loan) if _is_plain(loan) else amortize_many([loan]).schedule(0)
+
 def amortization_schedule(loan: Loan) -> List[Dict]:
-    payment = annuity_payment(loan.principal, loan.annual_rate, loan.years)
-    balance = loan.principal
-    schedule = []
-    for m in range(1, loan.months()+1):
-        interest = balance * (loan.annual_rate / 12.0)
-        principal_paid = min(balance, payment - interest)
-        balance = balance - principal_paid
-        schedule.append({'month': m-1, 'payment': payment if balance>0 else principal_paid+interest, 'interest': interest, 'principal': principal_paid, 'balance': max(0.0, balance)})
-        if balance <= 0:
-            break
-    return schedule
+    return amortize(loan).to_records()
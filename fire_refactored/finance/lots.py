@@ -0,0 +1,50 @@
+"""Array-backed tax lots for brokerage cost-basis tracking."""
+from dataclasses import dataclass
+from typing import Tuple
+import numpy as np
+
+METHODS = ('fifo', 'average')
+
+@dataclass(frozen=True)
+class LotBook:
+    """Parallel arrays of lots in purchase order: period bought, units held and their total cost."""
+    period: np.ndarray
+    units: np.ndarray
+    cost: np.ndarray
+    @classmethod
+    def from_contributions(cls, amounts: np.ndarray, prices: np.ndarray) -> 'LotBook':
+        """One lot per positive amount; amounts are (periods,) or (periods, holdings) and kept in period order."""
+        amounts = np.asarray(amounts, dtype=float)
+        prices = np.broadcast_to(np.asarray(prices, dtype=float), amounts.shape)
+        period = np.broadcast_to(np.arange(len(amounts)).reshape((-1,) + (1,) * (amounts.ndim - 1)), amounts.shape)
+        keep = amounts > 0
+        return cls(period=period[keep], units=amounts[keep] / prices[keep], cost=amounts[keep])
+    def __len__(self) -> int:
+        return len(self.units)
+    def value(self, price: float) -> float:
+        return float(self.units.sum() * price)
+    def _sold_units(self, amount: np.ndarray, price: float, method: str) -> np.ndarray:
+        # (..., n_lots) units sold per lot for each requested amount
+        if method not in METHODS:
+            raise ValueError(f"Unknown lot method {method!r}, expected one of {METHODS}")
+        wanted = np.minimum(np.asarray(amount, dtype=float) / price, self.units.sum())[..., None]
+        if method == 'average':
+            total = self.units.sum()
+            return self.units * (wanted / total if total > 0 else 0.0)
+        before = np.cumsum(self.units) - self.units
+        return np.clip(wanted - before, 0.0, self.units)
+    def taxable_gain(self, amount, price: float, method: str = 'fifo'):
+        """Gain realised by selling `amount` (scalar or array) at `price`; one vectorized pass over all lots."""
+        sold = self._sold_units(amount, price, method)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            unit_cost = np.where(self.units > 0, self.cost / self.units, 0.0)
+        gain = sold.sum(axis=-1) * price - (sold * unit_cost).sum(axis=-1)
+        return float(gain) if np.ndim(amount) == 0 else gain
+    def realize(self, amount: float, price: float, method: str = 'fifo') -> Tuple[float, 'LotBook']:
+        """Sell `amount`; returns the taxable gain and the remaining lots."""
+        sold = self._sold_units(amount, price, method)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(self.units > 0, sold / self.units, 0.0)
+        gain = float(sold.sum() * price - (fraction * self.cost).sum())
+        remaining = LotBook(period=self.period, units=self.units - sold, cost=self.cost * (1 - fraction))
+        return gain, remaining
@@ -1,16 +1,64 @@
 from dataclasses import dataclass, field
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterator
 import datetime
+import numpy as np
+
+def as_series(value, years: int, monthly: bool = False):
+    """Resolve a time-varying input to one value per period.
+
+    value is a scalar, a per-year array, a per-month array (at least 12*years long; monthly only)
+    or a callable taking the 1-based year array. A per-year array shorter than the horizon keeps
+    its last value. Scalars and (..., 1) batch columns are returned as they are for broadcasting;
+    float64 arrays long enough for the horizon are sliced, not copied. A yearly resolve rejects
+    a whole number of months covering the horizon, which can only be a per-month path.
+    """
+    if callable(value):
+        value = value(np.arange(1, years+1))
+    value = np.asarray(value, dtype=float)
+    if value.ndim == 0 or value.shape[-1] == 1:
+        return value
+    if not monthly and years > 0 and value.shape[-1] >= 12 * years and value.shape[-1] % 12 == 0:
+        raise ValueError(f"A path of {value.shape[-1]} values looks per-month; yearly projections need one value per year")
+    if monthly and value.shape[-1] >= 12 * years:
+        return value[..., :12 * years]
+    if value.shape[-1] < years:
+        value = np.concatenate([value, np.repeat(value[..., -1:], years - value.shape[-1], axis=-1)], axis=-1)
+    value = value[..., :years]
+    return np.repeat(value, 12, axis=-1) if monthly else value
+
+def _materialize(value):
+    # generators can only be consumed once, so they are read into an array up front
+    return np.fromiter(value, dtype=float) if isinstance(value, Iterator) else value
+
+LOAN_KINDS = ('annuity', 'serial')
 
 @dataclass
 class Loan:
+    """annual_rate may be time-varying (a rate reset re-annuitizes an annuity loan over the remaining term)."""
     principal: float
     annual_rate: float
     years: int
     start_date: Optional[datetime.date] = None
     name: str = "loan"
+    # monthly amount on top of the regular payment; scalar or time-varying (see as_series)
+    extra_payment: float = 0.0
+    kind: str = "annuity"
+    # one-off prepayments by month of the schedule (1-based)
+    one_off_payments: Dict[int, float] = field(default_factory=dict)
+    # interest-only months (1-based); each one moves the end of the term a month later
+    payment_holidays: List[int] = field(default_factory=list)
+    def __post_init__(self):
+        if self.kind not in LOAN_KINDS:
+            raise ValueError(f"Unknown loan kind {self.kind!r}, expected one of {LOAN_KINDS}")
+        self.annual_rate = _materialize(self.annual_rate)
+        self.extra_payment = _materialize(self.extra_payment)
     def monthly_rate(self) -> float:
         return self.annual_rate / 12.0
+    def monthly_rates(self) -> np.ndarray:
+        """Rate for each month of the term; annual_rate may be a scalar, per-year or per-month path."""
+        if np.ndim(self.annual_rate) == 0 and not callable(self.annual_rate):
+            return np.full(self.months(), self.annual_rate / 12.0)
+        return np.broadcast_to(as_series(self.annual_rate, self.years, monthly=True), (self.months(),)) / 12.0
     def months(self) -> int:
         return max(1, self.years * 12)
 
@@ -21,9 +69,11 @@ class Investment:
     annual_volatility: float = 0.15
     contributions_per_year: int = 1
     account_type: str = "brokerage"
+    contribution_weight: Optional[float] = None
 
 @dataclass
 class Person:
+    """salary, salary_growth, savings_rate and expenses are scalars or time-varying (see as_series)."""
     name: str
     salary: float
     savings_rate: float
@@ -32,3 +82,33 @@ class Person:
     investments: List[Investment] = field(default_factory=list)
     charity_donation: float = 0.0
     ips_contribution: float = 0.0
+    salary_growth: float = 0.0
+    # projection year (1-based) from which salary and regular savings stop
+    retirement_year: Optional[int] = None
+    # one-off contributions by projection year, invested like regular savings
+    lump_sums: Dict[int, float] = field(default_factory=dict)
+    def __post_init__(self):
+        for name in ('salary', 'salary_growth', 'savings_rate', 'expenses'):
+            setattr(self, name, _materialize(getattr(self, name)))
+
+@dataclass
+class Household:
+    """Persons projected together. Shared loans are split between members by debt_shares
+    (equal by default); each member is still taxed as an individual."""
+    name: str
+    members: List[Person]
+    shared_loans: List[Loan] = field(default_factory=list)
+    debt_shares: Optional[List[float]] = None
+    def __post_init__(self):
+        if not self.members:
+            raise ValueError("A household needs at least one member")
+        names = [m.name for m in self.members]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Household member names must be unique, got {names}")
+    def shares(self) -> np.ndarray:
+        if self.debt_shares is None:
+            return np.full(len(self.members), 1 / len(self.members))
+        shares = np.asarray(self.debt_shares, dtype=float)
+        if shares.shape != (len(self.members),) or np.any(shares < 0) or not np.isclose(shares.sum(), 1.0):
+            raise ValueError("debt_shares needs one non-negative share per member, summing to 1")
+        return shares
@@ -0,0 +1,132 @@
+"""Goal-seeking search over how yearly savings are used: IPS, ASK, brokerage and extra loan payments.
+
+A candidate puts an IPS amount (up to ips_contribution_limit) into IPS, a share of the rest into
+ASK and the remainder into brokerage, and pays a monthly extra amount on every loan. Each grid
+chunk is projected at once: holdings grow per account type, loans are amortized in one batch,
+and the IPS deduction's tax saving is invested with the rest. Chunks run in a ProcessPoolExecutor
+like parameter_sweep.
+
+Candidates are scored on after-tax real wealth: brokerage and ASK gains pay capital gains tax on
+liquidation, IPS is paid out as ordinary income (ordinary_tax_rate), debt is subtracted and the
+wealth tax paid along the way is deducted in real terms.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from itertools import repeat
+from typing import Any, Dict, Optional, Sequence
+import numpy as np
+import pandas as pd
+from .models import Person, as_series
+from .tax import TaxConfig
+from .loans import amortize_many
+from .simulation import ACCOUNT_TYPES, Simulation, _Holdings, _first_year_reached, _grow_holdings, _holdings, _projection_inputs
+
+OBJECTIVES = ('wealth', 'fire')
+
+def _account_holdings(person: Person) -> _Holdings:
+    # the person's holdings with contribution weights normalised within each account type; an
+    # account type without holdings gets an empty one at the portfolio's average return
+    holdings = _holdings(person)
+    weight = holdings.weight.copy()
+    extra = [k for k in range(len(ACCOUNT_TYPES)) if k not in holdings.account]
+    mix = holdings.principal if holdings.principal.sum() > 0 else np.ones(len(holdings.principal))
+    principal = np.append(holdings.principal, np.zeros(len(extra)))
+    annual_return = np.append(holdings.annual_return, np.full(len(extra), np.average(holdings.annual_return, weights=mix)))
+    volatility = np.append(holdings.annual_volatility, np.full(len(extra), np.average(holdings.annual_volatility, weights=mix)))
+    account = np.append(holdings.account, extra).astype(int)
+    weight = np.append(weight, np.ones(len(extra)))
+    for k in range(len(ACCOUNT_TYPES)):
+        inside = account == k
+        weight[inside] = weight[inside] / weight[inside].sum() if weight[inside].sum() > 0 else 1 / inside.sum()
+    return _Holdings(principal=principal, annual_return=annual_return, annual_volatility=volatility, account=account, weight=weight)
+
+def _current_split(person: Person) -> Dict[str, float]:
+    holdings = _holdings(person)
+    ask, brokerage = (holdings.weight[holdings.account == ACCOUNT_TYPES.index(k)].sum() for k in ('ASK', 'brokerage'))
+    extras = [float(loan.extra_payment) for loan in person.loans if np.ndim(loan.extra_payment) == 0]
+    return {'ips_contribution': float(person.ips_contribution), 'ask_share': float(ask / (ask + brokerage)) if ask + brokerage > 0 else 0.0,
+            'extra_payment': max(extras, default=0.0)}
+
+def _evaluate(person: Person, params: Dict[str, np.ndarray], years: int, inflation, tax_config: TaxConfig,
+              withdrawal_rate: float) -> pd.DataFrame:
+    sim = Simulation(tax_config)
+    cfg = sim.cfg
+    inputs = _projection_inputs(person, years, inflation=inflation)
+    n = len(params['ips_contribution'])
+    debt = np.zeros((n, years))
+    freed = np.zeros((n, years))
+    if person.loans:
+        # every (extra payment, loan) pair in one batch; 0 is the reference without extra payments
+        extras, inverse = np.unique(np.append(params['extra_payment'], 0.0), return_inverse=True)
+        batch = amortize_many([replace(loan, extra_payment=e) for e in extras for loan in person.loans])
+        shape = (len(extras), len(person.loans), years)
+        balance = batch.yearly_balance(years).reshape(shape).sum(axis=1)
+        paid = batch.padded('payment', 12 * years).reshape(shape + (12,)).sum(axis=(1, 3))
+        debt = balance[inverse[:-1]]
+        # extra payments come out of savings; an earlier payoff frees the regular payment
+        freed = paid[inverse[-1]] - paid[inverse[:-1]]
+    investable = np.maximum(inputs['saved'] + freed, 0.0)
+    ips = np.minimum(np.minimum(params['ips_contribution'], cfg.ips_contribution_limit)[:, None], investable)
+    engine = sim._period_engine(years)
+    gross = np.broadcast_to(inputs['gross'], (n, years))
+    other = min(person.charity_donation, cfg.charity_deduction_limit)
+    refund = engine.income_tax(gross, other) - engine.income_tax(gross, other + ips)
+    rest = investable - ips + refund
+    flows = {'IPS': ips, 'ASK': rest * params['ask_share'][:, None], 'brokerage': rest * (1 - params['ask_share'][:, None])}
+    holdings = _account_holdings(person)
+    values, bases = [], []
+    for k, name in enumerate(ACCOUNT_TYPES):
+        inside = holdings.account == k
+        start = np.where(inside, holdings.principal, 0.0)
+        held = _grow_holdings(start, 1 + holdings.returns(years), flows[name], np.where(inside, holdings.weight, 0.0))
+        values.append(held.sum(axis=-1))
+        bases.append(start.sum() + np.cumsum(flows[name], axis=-1))
+    value, basis = np.stack(values, axis=-1), np.stack(bases, axis=-1)
+    gains = np.maximum(value - basis, 0.0)
+    after_tax = (value[..., 0] + value[..., 1] - cfg.capital_gains_tax_rate * (gains[..., 0] + gains[..., 1])
+                 + value[..., 2] * (1 - cfg.ordinary_tax_rate) - debt)
+    wealth_tax = engine.wealth_tax(value.sum(axis=-1) - debt)
+    score = (after_tax - np.cumsum(wealth_tax / inputs['deflator'], axis=-1) * inputs['deflator']) / inputs['deflator']
+    return pd.DataFrame({**params, 'after_tax_real_wealth': score[:, -1], 'total_wealth_tax': wealth_tax.sum(axis=-1),
+                         'ips_tax_saving': refund.sum(axis=-1), 'final_debt': debt[:, -1],
+                         'years_to_fire': _first_year_reached(score, as_series(person.expenses, years) / withdrawal_rate)})
+
+def optimize_allocation(person: Person, years: int = 30, objective: str = 'wealth', inflation: float = 0.02,
+                        tax_config: Optional[TaxConfig] = None, withdrawal_rate: float = 0.04,
+                        ips_contribution: Optional[Sequence[float]] = None, ask_share: Optional[Sequence[float]] = None,
+                        extra_payment: Optional[Sequence[float]] = None, max_workers: Optional[int] = None,
+                        chunk_size: int = 5000) -> Dict[str, Any]:
+    """Score every combination of the grids and return the best split.
+
+    objective 'wealth' maximizes after-tax real wealth at the horizon; 'fire' minimizes the first
+    year it covers expenses / withdrawal_rate (ties go to the wealthier candidate). Grids default to
+    six IPS amounts up to the limit, ASK shares 0, 0.25, .., 1 and, with loans, six extra monthly
+    payments up to a quarter of the first year's monthly savings. Returns the best candidate, the
+    person's current split scored the same way and the ranked table.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}")
+    tax_config = tax_config or TaxConfig()
+    monthly_saving = float(np.ravel(_projection_inputs(person, years, inflation=inflation)['saved'])[0]) / 12
+    grid = {'ips_contribution': np.linspace(0.0, tax_config.ips_contribution_limit, 6) if ips_contribution is None else ips_contribution,
+            'ask_share': np.linspace(0.0, 1.0, 5) if ask_share is None else ask_share,
+            'extra_payment': (np.linspace(0.0, monthly_saving / 4, 6) if person.loans else [0.0]) if extra_payment is None else extra_payment}
+    mesh = np.meshgrid(*[np.asarray(v, dtype=float) for v in grid.values()], indexing='ij')
+    params = {k: m.ravel() for k, m in zip(grid, mesh)}
+    if np.any(params['ask_share'] < 0) or np.any(params['ask_share'] > 1) or np.any(params['ips_contribution'] < 0) or np.any(params['extra_payment'] < 0):
+        raise ValueError("ask_share must be within 0..1 and amounts non-negative")
+    current = {k: np.array([v]) for k, v in _current_split(person).items()}
+    n = len(params['ask_share'])
+    chunks = [{k: v[i:i+chunk_size] for k, v in params.items()} for i in range(0, n, chunk_size)] + [current]
+    if max_workers == 1 or len(chunks) <= 2:
+        frames = [_evaluate(person, c, years, inflation, tax_config, withdrawal_rate) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            frames = list(pool.map(_evaluate, repeat(person), chunks, repeat(years), repeat(inflation), repeat(tax_config), repeat(withdrawal_rate)))
+    table = pd.concat(frames[:-1], ignore_index=True)
+    if objective == 'wealth':
+        table = table.sort_values('after_tax_real_wealth', ascending=False, kind='stable')
+    else:
+        table = table.sort_values(['years_to_fire', 'after_tax_real_wealth'], ascending=[True, False], na_position='last', kind='stable')
+    table = table.reset_index(drop=True)
+    return {'objective': objective, 'best': table.iloc[0].to_dict(), 'current': frames[-1].iloc[0].to_dict(), 'table': table}
@@ -0,0 +1,103 @@
+"""Opt-in per-stage timers and call counters for the projection engines.
+
+Code marks its stages with `with stage('tax'):` or decorates whole functions with @timed(). Timing only happens while a Profiler is active
+in the current thread, either as a context manager (`with Profiler() as prof:`) or as a decorator
+(`@prof`); otherwise stage returns one shared no-op context, so an instrumented stage costs a
+thread-local lookup. Stages nest: total time includes nested stages, self time does not.
+"""
+from contextlib import ContextDecorator, nullcontext
+from typing import Any, Dict, List, Optional, Tuple
+import functools
+import json
+import os
+import threading
+import time
+
+_NULL = nullcontext()
+class _Local(threading.local):
+    # a class default keeps the disabled lookup off the slow missing-attribute path
+    profiler: Optional['Profiler'] = None
+
+_local = _Local()
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler, self.name = profiler, name
+    def __enter__(self):
+        self.profiler._nested.append(0)
+        self.start = time.perf_counter_ns()
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        nested = self.profiler._nested.pop()
+        if self.profiler._nested:
+            self.profiler._nested[-1] += end - self.start
+        self.profiler.record(self.name, self.start, end, nested)
+
+class Profiler(ContextDecorator):
+    """Collects stage timings while active; usable as a context manager or function decorator.
+
+    Entering it again (nested, or on repeated decorated calls) keeps adding to the same totals.
+    """
+    def __init__(self):
+        self.totals: Dict[str, int] = {}
+        self.own: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+        self.events: List[Tuple[str, int, int, int]] = []
+        self.wall = 0
+        self._origin = time.perf_counter_ns()
+        self._previous: List[Tuple[Optional['Profiler'], int]] = []
+        self._nested: List[int] = []
+    def __enter__(self) -> 'Profiler':
+        self._previous.append((_local.profiler, time.perf_counter_ns()))
+        _local.profiler = self
+        return self
+    def __exit__(self, *exc):
+        previous, start = self._previous.pop()
+        _local.profiler = previous
+        if not self._previous:
+            self.wall += time.perf_counter_ns() - start
+        return False
+    def record(self, name: str, start: int, end: int, nested: int = 0) -> None:
+        """Add one call of a stage; nested is the time spent in stages inside it (ns)."""
+        self.totals[name] = self.totals.get(name, 0) + end - start
+        self.own[name] = self.own.get(name, 0) + end - start - nested
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.events.append((name, start, end - start, threading.get_ident()))
+    def to_dict(self) -> Dict[str, Any]:
+        """Wall time while active and per stage calls, total, self and mean time in milliseconds, slowest first."""
+        stages = {name: {'calls': self.counts[name], 'total_ms': total / 1e6, 'self_ms': self.own[name] / 1e6,
+                         'mean_ms': total / 1e6 / self.counts[name]}
+                  for name, total in sorted(self.totals.items(), key=lambda kv: -kv[1])}
+        return {'wall_ms': self.wall / 1e6, 'stages': stages}
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Complete events in the Chrome trace format (chrome://tracing, Perfetto), times in microseconds."""
+        pid = os.getpid()
+        return {'traceEvents': [{'name': name, 'cat': 'finance', 'ph': 'X', 'ts': (start - self._origin) / 1e3, 'dur': duration / 1e3,
+                                 'pid': pid, 'tid': tid} for name, start, duration, tid in self.events],
+                'displayTimeUnit': 'ms'}
+    def save_trace(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+def active() -> Optional[Profiler]:
+    return _local.profiler
+
+def stage(name: str):
+    """Context timing one stage under the active profiler; a shared no-op when profiling is off."""
+    profiler = _local.profiler
+    return _NULL if profiler is None else _Stage(profiler, name)
+
+def timed(name: Optional[str] = None):
+    """Decorator timing every call of a function as a stage named name (default: its qualified name)."""
+    def wrap(func):
+        label = name or func.__qualname__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _local.profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            with _Stage(profiler, label):
+                return func(*args, **kwargs)
+        return wrapper
+    return wrap
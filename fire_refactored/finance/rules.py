@@ -0,0 +1,134 @@
+"""Versioned tax rules: one table per jurisdiction and tax year, read once per process.
+
+A table is a JSON (or YAML) file <directory>/<jurisdiction>/<year>.json holding every TaxConfig
+field, plus an optional "note". The package ships finance/rules/NO/, so loading works offline.
+A RuleSet compiles its tables into read-only arrays indexed by table, and per-year parameters
+for a projection are gathered from those arrays; years after a table keep its rules with the
+thresholds indexed by a yearly rate.
+"""
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Tuple
+import json
+import os
+import numpy as np
+from .tax import TaxConfig, TaxEngine, RATE_FIELDS, compile_brackets
+
+RULES_DIR = os.path.join(os.path.dirname(__file__), 'rules')
+TABLE_FIELDS = tuple(f.name for f in fields(TaxConfig))
+# money amounts that follow indexation; rates and statutory limits do not
+INDEXED = ('lowers', 'widths', 'base', 'wealth_threshold_single', 'wealth_high_threshold')
+
+def _read(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+def validate_table(table: Dict[str, Any], source: str = 'table') -> TaxConfig:
+    """TaxConfig from a raw table; every field is required and checked."""
+    if not isinstance(table, dict):
+        raise ValueError(f"{source}: expected a mapping of TaxConfig fields")
+    missing = set(TABLE_FIELDS) - set(table)
+    unknown = set(table) - set(TABLE_FIELDS) - {'note'}
+    if missing or unknown:
+        raise ValueError(f"{source}: missing fields {sorted(missing)}, unknown fields {sorted(unknown)}")
+    thresholds = np.asarray(table['bracket_thresholds'], dtype=float)
+    rates = np.asarray(table['bracket_rates'], dtype=float)
+    if thresholds.ndim != 1 or rates.ndim != 1 or len(rates) != len(thresholds) + 1:
+        raise ValueError(f"{source}: bracket_rates needs one rate more than bracket_thresholds")
+    if np.any(np.diff(thresholds) <= 0) or np.any(thresholds <= 0):
+        raise ValueError(f"{source}: bracket_thresholds must be positive and increasing")
+    scalars = {k: float(table[k]) for k in TABLE_FIELDS if k not in ('bracket_thresholds', 'bracket_rates')}
+    if any(v < 0 for v in scalars.values()) or np.any(rates < 0) or np.any(rates >= 1):
+        raise ValueError(f"{source}: amounts must be non-negative and rates below 1")
+    return TaxConfig(bracket_thresholds=thresholds.tolist(), bracket_rates=rates.tolist(), **scalars)
+
+def config_from_file(path: str) -> TaxConfig:
+    """One validated table from a JSON or YAML file."""
+    return validate_table(_read(path), path)
+
+@dataclass(frozen=True)
+class RuleSet:
+    """Tax tables of one jurisdiction, sorted by year and compiled to read-only arrays."""
+    jurisdiction: str
+    years: Tuple[int, ...]
+    configs: Tuple[TaxConfig, ...]
+    arrays: Dict[str, np.ndarray] = field(repr=False)
+    _periods: Dict[tuple, Dict[str, np.ndarray]] = field(default_factory=dict, repr=False, compare=False)
+    @classmethod
+    def from_configs(cls, jurisdiction: str, configs: Dict[int, TaxConfig]) -> 'RuleSet':
+        if not configs:
+            raise ValueError(f"No tax tables for {jurisdiction!r}")
+        years = tuple(sorted(configs))
+        compiled = [{**{k: np.float64(getattr(configs[y], k)) for k in RATE_FIELDS},
+                     **compile_brackets(configs[y].bracket_thresholds, configs[y].bracket_rates)} for y in years]
+        # tables with fewer brackets are padded with empty ones (zero rate and width)
+        width = max(len(c['rates']) for c in compiled)
+        arrays = {}
+        for k in compiled[0]:
+            if k in RATE_FIELDS:
+                arrays[k] = np.array([c[k] for c in compiled])
+            else:
+                arrays[k] = np.zeros((len(years), width))
+                for i, c in enumerate(compiled):
+                    arrays[k][i, :len(c[k])] = c[k]
+            arrays[k].setflags(write=False)
+        return cls(jurisdiction, years, tuple(configs[y] for y in years), arrays)
+    def table_index(self, year) -> np.ndarray:
+        """Index of the table in force in each year: the latest one not after it, else the earliest."""
+        return np.maximum(np.searchsorted(self.years, year, side='right') - 1, 0)
+    def config(self, year: int) -> TaxConfig:
+        return self.configs[int(self.table_index(year))]
+    def periods(self, start_year: int, years: int, indexation: float = 0.0, monthly: bool = False) -> Dict[str, np.ndarray]:
+        """Per-period parameters for tax years start_year.. (repeated per month when monthly); cached."""
+        key = (start_year, years, indexation, monthly)
+        if key not in self._periods:
+            year = start_year + np.arange(years)
+            idx = self.table_index(year)
+            factor = (1 + indexation) ** np.maximum(year - np.asarray(self.years)[idx], 0)
+            params = {}
+            for k, v in self.arrays.items():
+                value = v[idx] * (factor.reshape(-1, *([1] * (v.ndim - 1))) if k in INDEXED else 1.0)
+                value = np.repeat(value, 12, axis=0) if monthly else value
+                value.setflags(write=False)
+                params[k] = value
+            self._periods[key] = params
+        return self._periods[key]
+    def engine(self, start_year: int, years: int, indexation: float = 0.0, monthly: bool = False) -> TaxEngine:
+        return TaxEngine.per_period(self.config(start_year), self.periods(start_year, years, indexation, monthly))
+
+_LOADED: Dict[Tuple[str, str], RuleSet] = {}
+
+def available_rules(directory: str = RULES_DIR) -> Dict[str, List[int]]:
+    """Jurisdictions in directory with their table years."""
+    out = {}
+    for name in sorted(os.listdir(directory)):
+        if os.path.isdir(os.path.join(directory, name)):
+            out[name] = sorted(int(os.path.splitext(f)[0]) for f in os.listdir(os.path.join(directory, name))
+                               if f.endswith(('.json', '.yaml', '.yml')) and os.path.splitext(f)[0].isdigit())
+    return out
+
+def load_rules(jurisdiction: str = 'NO', directory: str = RULES_DIR) -> RuleSet:
+    """The jurisdiction's tables from directory, read and validated once per process.
+
+    Every caller shares the cached RuleSet; its configs are frozen TaxConfigs and its arrays
+    read-only, so no caller can change the rules another one sees.
+    """
+    key = (jurisdiction, os.path.abspath(directory))
+    if key not in _LOADED:
+        folder = os.path.join(directory, jurisdiction)
+        if not os.path.isdir(folder):
+            raise ValueError(f"No tax rules for {jurisdiction!r} in {directory}; available: {sorted(available_rules(directory))}")
+        configs = {}
+        for name in sorted(os.listdir(folder)):
+            stem, ext = os.path.splitext(name)
+            if ext in ('.json', '.yaml', '.yml') and stem.isdigit():
+                configs[int(stem)] = config_from_file(os.path.join(folder, name))
+        _LOADED[key] = RuleSet.from_configs(jurisdiction, configs)
+    return _LOADED[key]
+
+def tax_config(jurisdiction: str = 'NO', year: int = None) -> TaxConfig:
+    """TaxConfig in force in year (the latest shipped table by default)."""
+    rules = load_rules(jurisdiction)
+    return rules.config(rules.years[-1] if year is None else year)
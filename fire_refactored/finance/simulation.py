@@ -1,86 +1,621 @@
-from .models import Investment, Loan, Person
-from .loans import amortization_schedule
-from .tax import TaxEngine, TaxConfig
-from typing import List, Dict, Any
+from .models import Household, Investment, Loan, Person, as_series
+from .loans import amortize_many
+from .tax import TaxEngine, TaxConfig, RATE_FIELDS, _like
+from .rules import RuleSet
+from .cache import ResultCache, stable_hash
+from .lots import LotBook
+from .profiling import stage, timed
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+from dataclasses import dataclass, astuple, replace
 import numpy as np
-import pandas as pd
-from tabulate import tabulate
+from numpy.lib.stride_tricks import sliding_window_view
+if TYPE_CHECKING:
+    import pandas as pd
+
+ACCOUNT_TYPES = ('brokerage', 'ASK', 'IPS')
+# reported per member by Simulation.project_household, as '<column>_<member name>'
+MEMBER_COLUMNS = ('net_wealth', 'income_tax', 'wealth_tax')
+# summed when downsampling monthly rows to years; every other column keeps its year-end value
+FLOW_COLUMNS = ('gross_salary', 'deductions', 'income_tax', 'net_salary', 'saved', 'loan_payment', 'loan_interest')
 
 def real_value(nominal, inflation_rate, years):
     return [v / ((1+inflation_rate)**y) for y,v in enumerate(nominal, start=1)]
 
+@dataclass(frozen=True)
+class _Holdings:
+    """Investments as parallel arrays; account holds each holding's index into ACCOUNT_TYPES."""
+    principal: np.ndarray
+    annual_return: np.ndarray
+    annual_volatility: np.ndarray
+    account: np.ndarray
+    weight: np.ndarray
+    def returns(self, periods: int, monthly: bool = False) -> np.ndarray:
+        rate = (1 + self.annual_return) ** (1/12) - 1 if monthly else self.annual_return
+        return np.tile(rate, (periods, 1))
+
+def _holdings(person: Person) -> _Holdings:
+    # savings with nowhere to go sit in an idle brokerage holding, as before
+    investments = person.investments or [Investment(principal=0.0, annual_return=0.0, annual_volatility=0.0)]
+    principal = np.array([inv.principal for inv in investments], dtype=float)
+    if any(inv.contribution_weight is not None for inv in investments):
+        weight = np.array([inv.contribution_weight or 0.0 for inv in investments], dtype=float)
+    else:
+        weight = principal.copy()
+    weight = weight / weight.sum() if weight.sum() > 0 else np.full(len(investments), 1 / len(investments))
+    return _Holdings(principal=principal,
+                     annual_return=np.array([inv.annual_return for inv in investments], dtype=float),
+                     annual_volatility=np.array([inv.annual_volatility for inv in investments], dtype=float),
+                     account=np.array([ACCOUNT_TYPES.index(inv.account_type) for inv in investments]),
+                     weight=weight)
+
+def _stacked_holdings(persons: List[Person]) -> _Holdings:
+    """Holdings of several persons as (n_persons, 1, n_holdings) arrays, padded with empty holdings."""
+    parts = [_holdings(p) for p in persons]
+    width = max(len(h.principal) for h in parts)
+    pad = lambda name: np.stack([np.pad(getattr(h, name), (0, width - len(h.principal))) for h in parts])[:, None, :]
+    return _Holdings(principal=pad('principal'), annual_return=pad('annual_return'), annual_volatility=pad('annual_volatility'),
+                     account=pad('account'), weight=pad('weight'))
+
+def _account_totals(values: np.ndarray, account: np.ndarray) -> np.ndarray:
+    # (..., n_holdings) -> (..., 3): one bincount over all leading rows, offset per row;
+    # account is (n_holdings,) or broadcasts against values (per-member holdings of a household)
+    lead = values.shape[:-1]
+    rows = int(np.prod(lead, dtype=int))
+    account = account if np.ndim(account) == 1 else np.broadcast_to(account, values.shape).reshape(rows, -1)
+    codes = (np.arange(rows)[:, None] * len(ACCOUNT_TYPES) + account).ravel()
+    totals = np.bincount(codes, weights=values.reshape(rows, -1).ravel(), minlength=rows * len(ACCOUNT_TYPES))
+    return totals.reshape(lead + (len(ACCOUNT_TYPES),))
+
+def _salary_path(person: Person, years: int, salary=None, salary_growth=None, monthly: bool = False) -> np.ndarray:
+    # annual salary per period; salary and salary_growth may be time-varying or (..., 1) batch overrides,
+    # salary also per month when monthly (growth stays a yearly raise); zero from the retirement year on
+    salary = as_series(person.salary if salary is None else salary, years, monthly)
+    growth = as_series(person.salary_growth if salary_growth is None else salary_growth, years)
+    if growth.ndim == 0 or growth.shape[-1] == 1:
+        factor = (1 + growth) ** np.arange(years)
+    else:
+        # growth in year t raises the salary from year t+1 on
+        factor = np.cumprod(np.concatenate([np.ones(growth.shape[:-1] + (1,)), 1 + growth[..., :-1]], axis=-1), axis=-1)
+    working = np.ones(years, dtype=bool) if person.retirement_year is None else np.arange(1, years+1) < person.retirement_year
+    if monthly:
+        factor, working = np.repeat(factor, 12, axis=-1), np.repeat(working, 12)
+    return np.where(working, salary * factor, 0.0)
+
+def _deflator(inflation, years: int, monthly: bool = False) -> np.ndarray:
+    """Price level at the end of each period relative to today.
+
+    inflation is an annual rate: a scalar, (..., 1) batch, per-year path or, monthly, per-month path.
+    """
+    rate = as_series(inflation, years, monthly)
+    if rate.ndim == 0 or rate.shape[-1] == 1:
+        return (1 + rate) ** (np.arange(1, years * (12 if monthly else 1) + 1) / (12 if monthly else 1))
+    return np.cumprod((1 + rate) ** (1 / 12) if monthly else 1 + rate, axis=-1)
+
+def _lump_sums(person: Person, years: int) -> np.ndarray:
+    out = np.zeros(years)
+    for year, amount in person.lump_sums.items():
+        if int(year) < 1:
+            raise ValueError(f"lump_sums years start at 1, got {year}")
+        if int(year) <= years:
+            out[int(year) - 1] += amount
+    return out
+
+def _grow_holdings(start: np.ndarray, growth: np.ndarray, saved: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """Closed form of the per-period step b <- g * (b + saved * weight), elementwise per holding.
+
+    With P the cumulative growth, b_t = P_t * (b_0 + weight * sum_{k<=t} saved_k / P_{k-1}).
+    start and weight are (n_holdings,), growth (..., periods, n_holdings) and is overwritten
+    in place, saved (..., periods). Returns balances of shape (..., periods, n_holdings).
+    """
+    cumulative = np.cumprod(growth, axis=-2, out=growth)
+    out = np.empty(np.broadcast_shapes(cumulative.shape, np.shape(saved) + (1,)))
+    out[..., 0, :] = 1.0
+    out[..., 1:, :] = cumulative[..., :-1, :]
+    np.divide(np.asarray(saved)[..., None], out, out=out)
+    np.cumsum(out, axis=-2, out=out)
+    out *= weight
+    out += start
+    out *= cumulative
+    return out
+
+@timed('inputs')
+def _projection_inputs(person: Person, years: int, monthly: bool = False, inflation=0.02, salary=None, savings_rate=None,
+                       returns=None, debt=None) -> Dict[str, np.ndarray]:
+    """Per-period inputs of the deterministic projection; rows from period k on depend only on inputs from k on.
+
+    Yearly inputs accept the batch overrides of Simulation._columns. Monthly, salary and savings
+    are spread evenly over the year (savings_rate may also be a per-month path) and a lump sum
+    lands in the first month of its year.
+    """
+    rate = as_series(person.savings_rate if savings_rate is None else savings_rate, years, monthly)
+    if not monthly:
+        gross = _salary_path(person, years) if salary is None else salary
+        return {'gross': gross, 'saved': gross * rate + _lump_sums(person, years),
+                'returns': _holdings(person).returns(years) if returns is None else returns,
+                'debt': _debt_path(person.loans, years) if debt is None else debt, 'deflator': _deflator(inflation, years)}
+    months = years * 12
+    lumps = np.zeros(months)
+    lumps[::12] = _lump_sums(person, years)
+    gross = _salary_path(person, years, monthly=True) / 12
+    inputs = {'gross': gross, 'saved': gross * rate + lumps, 'returns': _holdings(person).returns(months, monthly=True),
+              'debt': np.zeros(months), 'deflator': _deflator(inflation, years, monthly=True),
+              'loan_payment': np.zeros(months), 'loan_interest': np.zeros(months)}
+    if person.loans:
+        with stage('loans'):
+            schedules = amortize_many(person.loans)
+        inputs['debt'] = schedules.padded('balance', months).sum(axis=0)
+        inputs['loan_payment'] = schedules.padded('payment', months).sum(axis=0)
+        inputs['loan_interest'] = schedules.padded('interest', months).sum(axis=0)
+    return inputs
+
+def _draw_growth(holdings: _Holdings, years: int, n_paths: int, seed: Optional[int]) -> np.ndarray:
+    # (n_paths, years, n_holdings) normal yearly growth factors, clipped at a 99% loss
+    rng = np.random.default_rng(seed)
+    growth = rng.standard_normal((n_paths, years, len(holdings.principal)))
+    growth *= holdings.annual_volatility
+    growth += 1 + holdings.annual_return
+    np.maximum(growth, 0.01, out=growth)
+    return growth
+
+@timed('loans')
+def _debt_path(loans: List[Loan], years: int) -> np.ndarray:
+    return amortize_many(loans).yearly_balance(years).sum(axis=0) if loans else np.zeros(years)
+
+def _first_year_reached(real_net_wealth: np.ndarray, target) -> np.ndarray:
+    """First year (1-based, on the last axis) in which real net wealth covers target; nan where it never does."""
+    reached = real_net_wealth >= target
+    return np.where(reached.any(axis=-1), reached.argmax(axis=-1) + 1.0, np.nan)
+
+def monthly_to_yearly(df: 'pd.DataFrame') -> 'pd.DataFrame':
+    """Downsample a project_monthly frame to one row per completed year."""
+    import pandas as pd
+    years = len(df) // 12
+    columns = {}
+    for col in df.columns:
+        if col == 'month':
+            continue
+        values = df[col].to_numpy()[:years*12].reshape(years, 12)
+        columns[col] = values.sum(axis=1) if col in FLOW_COLUMNS else values[:, -1]
+    return pd.DataFrame(columns)
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """A deterministic projection with its per-period inputs and end-of-period state.
+
+    held is every holding's value and contributed the cumulative savings at the end of each
+    period, so Simulation.project_incremental can resume from any period instead of period 1.
+    key holds the inputs that affect every period.
+    """
+    key: tuple
+    inputs: Dict[str, np.ndarray]
+    held: np.ndarray
+    contributed: np.ndarray
+    columns: Dict[str, np.ndarray]
+    frame: 'pd.DataFrame'
+    def first_change(self, key: tuple, inputs: Dict[str, np.ndarray]) -> int:
+        """Index of the first period whose inputs differ from these; the shorter horizon if none do."""
+        if key != self.key or inputs.keys() != self.inputs.keys():
+            return 0
+        n = min(len(inputs['saved']), len(self.inputs['saved']))
+        first = n
+        for name, values in inputs.items():
+            changed = np.flatnonzero((values[:n] != self.inputs[name][:n]).reshape(n, -1).any(axis=1))
+            if len(changed):
+                first = min(first, int(changed[0]))
+        return first
+
 class Simulation:
-    def __init__(self, tax_config: TaxConfig = None):
-        self.tax_engine = TaxEngine(tax_config or TaxConfig())
-        self.cfg = tax_config or TaxConfig()
-    def project_yearly(self, person: Person, years: int = 30, inflation: float = 0.02) -> pd.DataFrame:
+    """Projections under one TaxConfig, or under a RuleSet that switches tables per projection year.
+
+    With rules, projection year 1 is tax year start_year (default: the latest table), years after
+    a table keep its rules with thresholds indexed by indexation per year, and cfg is the table in
+    force in start_year (used for deduction limits and realization estimates).
+    """
+    def __init__(self, tax_config: TaxConfig = None, cache: Optional[ResultCache] = None, rules: Optional[RuleSet] = None,
+                 start_year: Optional[int] = None, indexation: float = 0.0):
+        self.rules = rules
+        self.start_year = (rules.years[-1] if start_year is None else start_year) if rules is not None else start_year
+        self.indexation = indexation
+        self.cfg = tax_config or (rules.config(self.start_year) if rules is not None else TaxConfig())
+        self._engine = TaxEngine(self.cfg)
+        self.cache = cache
+        self._rules_key = None if rules is None else (rules.jurisdiction, rules.years, self.start_year, indexation)
+    @property
+    def tax_engine(self) -> TaxEngine:
+        # follows reassignments of cfg
+        if self._engine.cfg is not self.cfg:
+            self._engine = TaxEngine(self.cfg)
+        return self._engine
+    def _period_engine(self, periods: int, monthly: bool = False, first: int = 0) -> TaxEngine:
+        # rules for periods first+1..periods, gathered from the compiled tables
+        if self.rules is None:
+            return self.tax_engine
+        per_year = 12 if monthly else 1
+        params = self.rules.periods(self.start_year, -(-periods // per_year), self.indexation, monthly)
+        return TaxEngine.per_period(self.cfg, {k: v[first:periods] for k, v in params.items()})
+    def _cached(self, compute, *inputs) -> 'pd.DataFrame':
+        if self.cache is None:
+            return compute()
+        try:
+            with stage('cache_key'):
+                key = stable_hash(self.cfg, self._rules_key, *inputs)
+        except TypeError:
+            # e.g. a callable salary path: no stable key, so never cached
+            return compute()
+        return self.cache.get_or_compute(key, compute).copy()
+    @timed('frame')
+    def _frame(self, columns: Dict[str, np.ndarray]) -> 'pd.DataFrame':
+        import pandas as pd
+        return pd.DataFrame(columns)
+    @timed()
+    def project_yearly(self, person: Person, years: int = 30, inflation: float = 0.02) -> 'pd.DataFrame':
+        return self._cached(lambda: self._frame(self._columns(person, years, inflation)), 'yearly', person, years, inflation)
+    @timed()
+    def summary(self, person: Person, years: int = 30, inflation=0.02, withdrawal_rate: float = 0.04) -> Dict[str, float]:
+        """Final balances, total taxes and years to FIRE (nan if not reached) of the yearly projection, without a frame."""
+        cols = self._columns(person, years, inflation)
+        return {**{k: float(cols[k][-1]) for k in ('total_assets', 'debt', 'net_wealth', 'real_net_wealth', 'cumulative_contrib')},
+                'total_income_tax': float(cols['income_tax'].sum()), 'total_wealth_tax': float(cols['wealth_tax'].sum()),
+                'years_to_fire': float(_first_year_reached(cols['real_net_wealth'], as_series(person.expenses, years) / withdrawal_rate))}
+    def _columns(self, person: Person, years: int, inflation=0.02, salary=None, savings_rate=None, returns=None, debt=None) -> Dict[str, np.ndarray]:
+        """Yearly projection columns, optionally batched along leading axes.
+
+        Overrides replace the person's own values: salary and debt are (..., years),
+        savings_rate and inflation (..., 1) and returns (..., years, n_holdings). Person inputs and
+        inflation may also be time-varying (see models.as_series).
+        """
+        inputs = _projection_inputs(person, years, inflation=inflation, salary=salary, savings_rate=savings_rate, returns=returns, debt=debt)
+        return self._rows(_holdings(person), self._deductions(person), inputs)[0]
+    def _deductions(self, person: Person) -> float:
+        return min(person.ips_contribution, self.cfg.ips_contribution_limit) + min(person.charity_donation, self.cfg.charity_deduction_limit)
+    def _rows(self, holdings: _Holdings, deductions, inputs: Dict[str, np.ndarray], monthly: bool = False, first: int = 0, start=None,
+              engine: Optional[TaxEngine] = None):
+        """Projection columns for periods first+1.. from per-period inputs and annual deductions.
+
+        start is the (held, contributed) state at the end of period first, taken from a Checkpoint;
+        without it the holdings start at their principal. engine replaces the simulation's tax
+        rules. Returns (columns, held, contributed).
+        """
+        per_year = 12 if monthly else 1
+        period = np.arange(first + 1, np.shape(inputs['saved'])[-1] + 1)
+        engine = engine or self._period_engine(int(period[-1]), monthly, first)
+        inputs = {k: v[..., first:, :] if k == 'returns' else v[..., first:] for k, v in inputs.items()}
+        held0, contributed0 = (holdings.principal, 0.0) if start is None else start
+        saved = inputs['saved']
+        with stage('growth'):
+            held = _grow_holdings(held0, 1 + inputs['returns'], saved, holdings.weight)
+            contributed = contributed0 + np.cumsum(saved, axis=-1)
+            assets = _account_totals(held, holdings.account)
+            basis = _account_totals(holdings.principal + holdings.weight * contributed[..., None], holdings.account)
+        total_assets = assets.sum(axis=-1)
+        debt = inputs['debt']
+        net_wealth = total_assets - debt
+        shape = net_wealth.shape
+        # no path dependency in income: salary, deductions and taxes are one broadcast column each
+        gross = np.broadcast_to(inputs['gross'], shape)
+        saved = np.broadcast_to(saved, shape)
+        deductions = np.broadcast_to(np.asarray(deductions, dtype=float) / per_year, shape)
+        with stage('tax'):
+            income_tax = engine.income_tax(gross * per_year, deductions=deductions * per_year) / per_year
+            wealth_tax = engine.wealth_tax(net_wealth)
+        columns = {'month': period} if monthly else {}
+        columns.update({
+            'year': np.broadcast_to((period + per_year - 1) // per_year, shape),
+            'assets_brokerage': assets[..., 0],
+            'assets_ASK': assets[..., 1],
+            'assets_IPS': assets[..., 2],
+            'total_assets': total_assets,
+            'debt': np.broadcast_to(debt, shape),
+            'net_wealth': net_wealth,
+            'gross_salary': gross,
+            'deductions': deductions,
+            'income_tax': income_tax,
+            'net_salary': gross - income_tax,
+            'wealth_tax': wealth_tax,
+            'saved': saved,
+            'cumulative_contrib': np.broadcast_to(contributed, shape),
+            'basis_brokerage': basis[..., 0],
+            'basis_ASK': basis[..., 1],
+            'basis_IPS': basis[..., 2]
+        })
+        if monthly:
+            columns.update(loan_payment=inputs['loan_payment'], loan_interest=inputs['loan_interest'])
+        columns['real_net_wealth'] = net_wealth / inputs['deflator']
+        return columns, held, contributed
+    @timed()
+    def project_household(self, household: Household, years: int = 30, inflation: float = 0.02) -> 'pd.DataFrame':
+        return self._cached(lambda: self._frame(self._household_columns(household, years, inflation)), 'household', household, years, inflation)
+    def _household_columns(self, household: Household, years: int, inflation=0.02) -> Dict[str, np.ndarray]:
+        """Household totals plus per-member net wealth and taxes, with the members as one stacked batch.
+
+        Each member pays income tax on their own salary and deductions, and wealth tax on their
+        own holdings less their own loans and their share of the shared loans, so every member
+        gets the personal wealth-tax threshold.
+        """
+        members = household.members
+        inputs = [_projection_inputs(p, years, inflation=inflation) for p in members]
+        holdings = _stacked_holdings(members)
+        stacked = {k: np.stack([np.broadcast_to(i[k], (years,)) for i in inputs]) for k in ('gross', 'saved', 'debt')}
+        stacked['debt'] += household.shares()[:, None] * _debt_path(household.shared_loans, years)
+        stacked['returns'] = np.broadcast_to(holdings.annual_return, (len(members), years, holdings.principal.shape[-1]))
+        stacked['deflator'] = _deflator(inflation, years)
+        rows = self._rows(holdings, np.array([[self._deductions(p)] for p in members]), stacked)[0]
+        columns = {k: v[0] if k == 'year' else v.sum(axis=0) for k, v in rows.items()}
+        for k in MEMBER_COLUMNS:
+            columns.update({f'{k}_{p.name}': rows[k][i] for i, p in enumerate(members)})
+        return columns
+    @timed()
+    def project_monthly(self, person: Person, years: int = 30, inflation: float = 0.02, yearly: bool = False) -> 'pd.DataFrame':
+        return self._cached(lambda: self._project_monthly(person, years, inflation, yearly), 'monthly', person, years, inflation, yearly)
+    def _project_monthly(self, person: Person, years: int, inflation: float, yearly: bool) -> 'pd.DataFrame':
+        """Month-by-month projection; savings and salary are spread evenly over the year.
+
+        Returns compound monthly at (1 + annual_return)**(1/12), loan balances and payments come
+        straight from the amortization schedule, and wealth_tax is the annual tax on that month's
+        net wealth. With yearly=True the result is downsampled via monthly_to_yearly.
+        """
+        df = self._frame(self._rows(_holdings(person), self._deductions(person), _projection_inputs(person, years, True, inflation), monthly=True)[0])
+        return monthly_to_yearly(df) if yearly else df
+    @timed()
+    def project_incremental(self, person: Person, years: int = 30, inflation: float = 0.02, monthly: bool = False,
+                            previous: Optional[Checkpoint] = None) -> Checkpoint:
+        """Project like project_yearly (or project_monthly), resuming previous at the first period the edit changes.
+
+        Pass the returned Checkpoint back as previous after the next edit. Rows before the first
+        changed period are reused from previous.frame; edits to investments, deductions or the tax
+        config change every period and recompute from the start.
+        """
+        key = (astuple(self.cfg), self._rules_key, tuple(astuple(inv) for inv in person.investments), person.ips_contribution, person.charity_donation, monthly)
+        inputs = _projection_inputs(person, years, monthly, inflation)
+        periods = len(inputs['saved'])
+        first = 0 if previous is None else previous.first_change(key, inputs)
+        if first >= periods:
+            # unchanged, or only shortened
+            if periods == len(previous.frame):
+                return previous
+            columns = {k: v[:periods] for k, v in previous.columns.items()}
+            return Checkpoint(key, inputs, previous.held[:periods], previous.contributed[:periods], columns, self._frame(columns))
+        start = None if first == 0 else (previous.held[first-1], previous.contributed[first-1])
+        columns, held, contributed = self._rows(_holdings(person), self._deductions(person), inputs, monthly, first, start)
+        if first:
+            columns = {k: np.concatenate([previous.columns[k][:first], v]) for k, v in columns.items()}
+            held = np.concatenate([previous.held[:first], held])
+            contributed = np.concatenate([previous.contributed[:first], contributed])
+        return Checkpoint(key, inputs, held, contributed, columns, self._frame(columns))
+    @timed()
+    def project_monte_carlo(self, person: Person, years: int = 30, n_paths: int = 10_000, seed: Optional[int] = None,
+                            inflation: float = 0.02, fire_target: Optional[float] = None, withdrawal_rate: float = 0.04) -> Dict[str, Any]:
+        """Project n_paths random return paths at once and summarise them.
+
+        Yearly returns are drawn as one (n_paths, years, n_investments) normal array using each
+        investment's annual_return and annual_volatility. fire_target is in today's money and
+        defaults to expenses / withdrawal_rate (per year when expenses vary); it is compared
+        against real net wealth.
+        """
+        holdings = _holdings(person)
+        inputs = _projection_inputs(person, years, inflation=inflation)
+        with stage('growth'):
+            growth = _draw_growth(holdings, years, n_paths, seed)
+            total_assets = _grow_holdings(holdings.principal, growth, inputs['saved'], holdings.weight).sum(axis=-1)
+            del growth
+        net_wealth = total_assets - inputs['debt']
+        real_net_wealth = net_wealth / inputs['deflator']
+        with stage('tax'):
+            wealth_tax = self._period_engine(years).wealth_tax(net_wealth)
+        target = as_series(person.expenses, years) / withdrawal_rate if fire_target is None else fire_target
+        reached = np.logical_or.accumulate(real_net_wealth >= target, axis=1)
+        import pandas as pd
+        nominal = np.percentile(net_wealth, [5, 50, 95], axis=0)
+        real = np.percentile(real_net_wealth, [5, 50, 95], axis=0)
+        bands = pd.DataFrame({
+            'year': np.arange(1, years+1),
+            'net_wealth_p5': nominal[0], 'net_wealth_p50': nominal[1], 'net_wealth_p95': nominal[2],
+            'real_net_wealth_p5': real[0], 'real_net_wealth_p50': real[1], 'real_net_wealth_p95': real[2],
+            'wealth_tax_p50': np.median(wealth_tax, axis=0),
+            'fire_probability': reached.mean(axis=0)
+        })
+        return {'bands': bands, 'fire_target': target, 'fire_probability': float(reached[:, -1].mean()) if years else 0.0, 'n_paths': n_paths}
+    def _fire_curve(self, person: Person, years: int, inflation, profile=1.0):
+        # real net wealth is affine in a savings-rate multiplier m: real[y] = base[y] + m * slope[y],
+        # where m * profile[y] is the savings rate in year y
+        holdings = _holdings(person)
+        deflator = _deflator(inflation, years)
+        base = _grow_holdings(holdings.principal, 1 + holdings.returns(years), _lump_sums(person, years), holdings.weight).sum(axis=-1)
+        slope = _grow_holdings(np.zeros_like(holdings.principal), 1 + holdings.returns(years), _salary_path(person, years) * profile, holdings.weight).sum(axis=-1)
+        return (base - _debt_path(person.loans, years)) / deflator, slope / deflator
+    @timed()
+    def years_to_fire(self, person: Person, withdrawal_rate=0.04, inflation: float = 0.02, max_years: int = 100, savings_rate=None):
+        """First projection year in which real net wealth covers expenses / withdrawal_rate.
+
+        withdrawal_rate and savings_rate (default person.savings_rate) may be arrays and are
+        broadcast together, which is the batch form; a time-varying person.savings_rate is used
+        as given. Returns nan where FIRE is not reached within max_years.
+        """
+        profile = 1.0
+        if savings_rate is None and (callable(person.savings_rate) or np.ndim(person.savings_rate) > 0):
+            profile, savings_rate = as_series(person.savings_rate, max_years), 1.0
+        base, slope = self._fire_curve(person, max_years, inflation, profile)
+        rate = np.asarray(person.savings_rate if savings_rate is None else savings_rate, dtype=float)
+        rate, withdrawal_rate = np.broadcast_arrays(rate, np.asarray(withdrawal_rate, dtype=float))
+        years = _first_year_reached(base + rate[..., None] * slope, as_series(person.expenses, max_years) / withdrawal_rate[..., None])
+        return _like(rate, years)
+    def required_savings_rate(self, person: Person, target_year, withdrawal_rate=0.04, inflation: float = 0.02):
+        """Smallest constant savings rate that reaches FIRE by target_year; nan if it would exceed 1.
+
+        Solved in closed form from the affine dependence of real net wealth on the savings rate.
+        target_year and withdrawal_rate may be arrays (batch form).
+        """
+        target_year, withdrawal_rate = np.broadcast_arrays(np.asarray(target_year, dtype=int), np.asarray(withdrawal_rate, dtype=float))
+        horizon = int(target_year.max(initial=1))
+        base, slope = self._fire_curve(person, horizon, inflation)
+        target = as_series(person.expenses, horizon) / withdrawal_rate[..., None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            needed = np.where(base >= target, 0.0, np.where(slope > 0, (target - base) / slope, np.inf))
+        needed = np.where(np.arange(1, horizon+1) <= target_year[..., None], needed, np.inf).min(axis=-1)
+        needed = np.where(needed <= 1.0, np.maximum(needed, 0.0), np.nan)
+        return _like(target_year, needed)
+    @timed()
+    def sensitivities(self, person: Person, years: int = 30, inflation=0.02, rel_step: float = 0.01, withdrawal_rate: float = 0.04) -> 'pd.DataFrame':
+        """Elasticities of terminal net wealth, real net wealth, years to FIRE and total tax to every numeric input.
+
+        Every non-zero numeric field of the person, their loans and investments, the tax config and
+        inflation is scaled by 1 +- rel_step. All bumped scenarios are projected in one batch along a
+        leading axis, and the elasticity is the central difference (high - low) / (2 rel_step base).
+        Years to FIRE is interpolated between years so small bumps register; total_tax is the income
+        and wealth tax over the horizon, the metric the tax fields act on. Returns one row per
+        (parameter, metric), largest swing first within each metric, ready for a tornado chart.
+        """
+        cfg = self.cfg
+        holdings = _holdings(person)
+        names = {}
+        def add(name, value, horizon=years):
+            value = as_series(value, horizon)
+            if np.any(value != 0):
+                names[name] = float(np.mean(value))
+        for name in ('salary', 'salary_growth', 'savings_rate', 'expenses', 'charity_donation', 'ips_contribution'):
+            add(name, getattr(person, name))
+        for i, loan in enumerate(person.loans):
+            for name in ('principal', 'annual_rate', 'extra_payment'):
+                add(f'loans[{i}].{name}', getattr(loan, name), loan.years)
+        for j, inv in enumerate(person.investments):
+            add(f'investments[{j}].principal', inv.principal)
+            add(f'investments[{j}].annual_return', inv.annual_return)
+        for name in RATE_FIELDS + ('ips_contribution_limit', 'charity_deduction_limit', 'bracket_thresholds', 'bracket_rates'):
+            add(f'tax.{name}', np.mean(getattr(cfg, name)) if name.startswith('bracket') else getattr(cfg, name))
+        add('inflation', inflation)
+        index = {name: i for i, name in enumerate(names)}
+        n = 1 + 2 * len(names)
+        def factor(name):
+            # row 0 is the base, rows 2i+1 / 2i+2 scale parameter i up / down
+            f = np.ones(n)
+            if name in index:
+                f[2 * index[name] + 1], f[2 * index[name] + 2] = 1 + rel_step, 1 - rel_step
+            return f
+        growth = factor('salary_growth')[:, None] * as_series(person.salary_growth, years)
+        gross = _salary_path(person, years, salary_growth=growth) * factor('salary')[:, None]
+        saved = gross * (factor('savings_rate')[:, None] * as_series(person.savings_rate, years)) + _lump_sums(person, years)
+        principal = holdings.principal * np.stack([factor(f'investments[{j}].principal') for j in range(len(holdings.principal))], axis=-1)
+        weight = np.broadcast_to(holdings.weight, principal.shape)
+        if person.investments and all(inv.contribution_weight is None for inv in person.investments):
+            total = principal.sum(axis=-1, keepdims=True)
+            weight = np.where(total > 0, principal / np.where(total > 0, total, 1.0), 1 / principal.shape[-1])
+        returns = holdings.annual_return * np.stack([factor(f'investments[{j}].annual_return') for j in range(len(holdings.principal))], axis=-1)
+        bumped = _Holdings(principal=principal[:, None, :], annual_return=returns[:, None, :], annual_volatility=holdings.annual_volatility,
+                           account=holdings.account, weight=weight[:, None, :])
+        debt = np.tile(_debt_path(person.loans, years), (n, 1))
+        changed = [(row, i, replace(loan, **{name: (as_series(value, loan.years, monthly=True) if np.ndim(value) or callable(value) else value) * f}))
+                   for i, loan in enumerate(person.loans) for name in ('principal', 'annual_rate', 'extra_payment')
+                   if f'loans[{i}].{name}' in index for value in [getattr(loan, name)]
+                   for row, f in ((2 * index[f'loans[{i}].{name}'] + 1, 1 + rel_step), (2 * index[f'loans[{i}].{name}'] + 2, 1 - rel_step))]
+        if changed:
+            # every bumped loan in one batch; a scenario swaps one loan's path for its bumped path
+            base_paths = amortize_many(person.loans).yearly_balance(years)
+            paths = amortize_many([loan for _, _, loan in changed]).yearly_balance(years)
+            for (row, i, _), path in zip(changed, paths):
+                debt[row] += path - base_paths[i]
+        inputs = {'gross': gross, 'saved': saved, 'returns': np.broadcast_to(returns[:, None, :], (n, years, returns.shape[-1])), 'debt': debt,
+                  'deflator': _deflator(factor('inflation')[:, None] * as_series(inflation, years), years)}
+        deductions = (np.minimum(person.ips_contribution * factor('ips_contribution'), cfg.ips_contribution_limit * factor('tax.ips_contribution_limit'))
+                      + np.minimum(person.charity_donation * factor('charity_donation'), cfg.charity_deduction_limit * factor('tax.charity_deduction_limit')))
+        base = self._period_engine(years)._params
+        thresholds, rates = factor('tax.bracket_thresholds')[:, None, None], factor('tax.bracket_rates')[:, None, None]
+        params = {k: factor(f'tax.{k}')[:, None] * base[k] for k in RATE_FIELDS}
+        params.update(lowers=thresholds * base['lowers'], widths=thresholds * base['widths'], rates=rates * base['rates'], base=thresholds * rates * base['base'])
+        columns = self._rows(bumped, deductions[:, None], inputs, engine=TaxEngine.per_period(cfg, params))[0]
+        gap = columns['real_net_wealth'] - factor('expenses')[:, None] * as_series(person.expenses, years) / withdrawal_rate
+        reached = gap >= 0
+        k = reached.argmax(axis=-1)
+        previous = gap[np.arange(n), np.maximum(k - 1, 0)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing = np.where(k == 0, 1.0, k + previous / (previous - gap[np.arange(n), k]))
+        metrics = {'net_wealth': columns['net_wealth'][:, -1], 'real_net_wealth': columns['real_net_wealth'][:, -1],
+                   'years_to_fire': np.where(reached.any(axis=-1), crossing, np.nan),
+                   'total_tax': (columns['income_tax'] + columns['wealth_tax']).sum(axis=-1)}
         rows = []
-        assets_by_account = { 'brokerage': sum(inv.principal for inv in person.investments if inv.account_type=='brokerage'),
-                              'ASK': sum(inv.principal for inv in person.investments if inv.account_type=='ASK'),
-                              'IPS': sum(inv.principal for inv in person.investments if inv.account_type=='IPS') }
-        debts = sum(loan.principal for loan in person.loans)
-        cumulative_contrib = 0.0
-        for year in range(1, years+1):
-            gross = person.salary
-            ips_deduction = min(person.ips_contribution, self.cfg.ips_contribution_limit)
-            charity_deduction = min(person.charity_donation, self.cfg.charity_deduction_limit)
-            deductions = ips_deduction + charity_deduction
-            saved = gross * person.savings_rate
-            cumulative_contrib += saved
-            total_assets = sum(assets_by_account.values())
-            if total_assets <= 0:
-                assets_by_account['brokerage'] += saved
-            else:
-                for k in assets_by_account.keys():
-                    assets_by_account[k] += saved * (assets_by_account[k] / total_assets)
-            # growth
-            for inv in person.investments:
-                assets_by_account[inv.account_type] *= (1 + inv.annual_return)
-            # loan amortization simplified
-            for loan in person.loans:
-                schedule = amortization_schedule(loan)
-                principal_paid = sum(item['principal'] for item in schedule[:12])
-                loan.principal = max(0.0, loan.principal - principal_paid)
-            debts = sum(loan.principal for loan in person.loans)
-            net_wealth = sum(assets_by_account.values()) - debts
-            income_tax = self.tax_engine.income_tax(gross, deductions=deductions)
-            net_salary = gross - income_tax
-            wealth_tax = self.tax_engine.wealth_tax(net_wealth)
-            rows.append({
-                'year': year,
-                'assets_brokerage': assets_by_account['brokerage'],
-                'assets_ASK': assets_by_account['ASK'],
-                'assets_IPS': assets_by_account['IPS'],
-                'total_assets': sum(assets_by_account.values()),
-                'debt': debts,
-                'net_wealth': net_wealth,
-                'gross_salary': gross,
-                'deductions': deductions,
-                'income_tax': income_tax,
-                'net_salary': net_salary,
-                'wealth_tax': wealth_tax,
-                'saved': saved,
-                'cumulative_contrib': cumulative_contrib
-            })
-        df = pd.DataFrame(rows)
-        df['real_net_wealth'] = [v / ((1+inflation)**i) for i,v in enumerate(df['net_wealth'].tolist(), start=1)]
-        return df
-    def realize_and_tax(self, df: pd.DataFrame, realize_ask: float = 0.0, realize_brokerage: float = 0.0, realize_ips_withdraw: float = 0.0) -> Dict[str, float]:
+        for metric, values in metrics.items():
+            for name, i in index.items():
+                low, high = values[2*i + 2], values[2*i + 1]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    elasticity = (high - low) / (2 * rel_step * values[0])
+                rows.append({'parameter': name, 'base_value': names[name], 'metric': metric, 'base': values[0], 'low': low, 'high': high,
+                             'elasticity': elasticity, 'swing': abs(high - low)})
+        import pandas as pd
+        table = pd.DataFrame(rows, columns=['parameter', 'base_value', 'metric', 'base', 'low', 'high', 'elasticity', 'swing'])
+        table['metric'] = pd.Categorical(table['metric'], categories=list(metrics), ordered=True)
+        return table.sort_values(['metric', 'swing'], ascending=[True, False], na_position='last', kind='stable').reset_index(drop=True)
+    @timed()
+    def backtest(self, person: Person, returns_series, inflation_series=0.02, years: int = 30, withdrawal_rate: float = 0.04,
+                 start_year: int = 0) -> Dict[str, Any]:
+        """Project the person from every start year of a historical series, all windows in one batch.
+
+        returns_series is (n,) for every holding or (n, n_holdings); inflation_series is a scalar or
+        (n,). Windows of `years` consecutive values are sliding-window views, so nothing is copied
+        until the projection. A window succeeds if real net wealth reaches expenses / withdrawal_rate.
+        start_year labels the first value of the series (e.g. history['year'][0]).
+        """
+        holdings = _holdings(person)
+        returns = np.asarray(returns_series, dtype=float)
+        returns = returns[:, None] if returns.ndim == 1 else returns
+        if len(returns) < years:
+            raise ValueError(f"Need at least {years} years of history, got {len(returns)}")
+        if returns.shape[1] not in (1, len(holdings.principal)):
+            raise ValueError(f"returns_series has {returns.shape[1]} columns for {len(holdings.principal)} holdings")
+        windows = np.moveaxis(sliding_window_view(returns, years, axis=0), -1, 1)
+        n_windows = len(windows)
+        windows = np.broadcast_to(windows, (n_windows, years, len(holdings.principal)))
+        inflation = inflation_series if np.ndim(inflation_series) == 0 else sliding_window_view(np.asarray(inflation_series, dtype=float), years)[:n_windows]
+        real = self._columns(person, years, inflation, returns=windows)['real_net_wealth']
+        fire = _first_year_reached(real, as_series(person.expenses, years) / withdrawal_rate)
+        import pandas as pd
+        table = pd.DataFrame({
+            'start_year': start_year + np.arange(n_windows),
+            'final_real_net_wealth': real[:, -1],
+            'years_to_fire': fire,
+            'success': ~np.isnan(fire)
+        })
+        bands = pd.DataFrame({
+            'year': np.arange(1, years+1),
+            'real_net_wealth_worst': real.min(axis=0), 'real_net_wealth_p50': np.median(real, axis=0), 'real_net_wealth_best': real.max(axis=0),
+            'fire_rate': (fire[:, None] <= np.arange(1, years+1)).mean(axis=0)
+        })
+        order = np.argsort(real[:, -1], kind='stable')
+        pick = lambda i: table.iloc[order[i]].to_dict()
+        return {'table': table, 'bands': bands, 'worst': pick(0), 'median': pick(n_windows // 2), 'best': pick(-1),
+                'success_rate': float(table['success'].mean()), 'n_windows': n_windows}
+    def brokerage_lots(self, person: Person, years: int = 30, monthly: bool = False) -> LotBook:
+        """Brokerage tax lots at the end of the projection: the initial principal plus one lot per contribution and holding."""
+        holdings = _holdings(person)
+        inputs = _projection_inputs(person, years, monthly)
+        returns, saved = inputs['returns'], inputs['saved']
+        brokerage = holdings.account == 0
+        price = np.cumprod(1 + returns[:, brokerage], axis=0)
+        ones = np.ones((2, brokerage.sum()))
+        # lot 0 is the initial principal, lot t the contribution bought at the start of period t;
+        # prices are normalised to 1 at the end so lots of different holdings can be pooled
+        amounts = np.vstack([holdings.principal[brokerage], saved[:, None] * holdings.weight[brokerage]])
+        return LotBook.from_contributions(amounts, np.vstack([ones, price[:-1]]) / price[-1])
+    def realize_and_tax(self, df: 'pd.DataFrame', realize_ask: float = 0.0, realize_brokerage: float = 0.0, realize_ips_withdraw: float = 0.0,
+                        lots: Optional[LotBook] = None, method: str = 'fifo') -> Dict[str, float]:
+        """Tax on realizing amounts from the final row of a projection.
+
+        ASK withdrawals are taxed above the deposited basis. Brokerage gains use average cost
+        from basis_brokerage, or the given lots (from brokerage_lots) with FIFO/average matching.
+        """
         final = df.iloc[-1]
         results = {}
-        total_assets = final['total_assets']
-        total_contrib = final['cumulative_contrib']
-        total_gain = max(0.0, total_assets - total_contrib)
+        basis = final['basis_brokerage'] + final['basis_ASK'] + final['basis_IPS']
+        total_gain = float(max(0.0, final['total_assets'] - basis))
         tax_ask = tax_brokerage = tax_ips = 0.0
         if realize_ask>0:
-            ask_balance = final['assets_ASK']
-            ask_contrib_share = total_contrib * (ask_balance/total_assets) if total_assets>0 else 0
-            ask_gain = max(0.0, min(realize_ask, ask_balance) - ask_contrib_share)
+            ask_gain = max(0.0, min(realize_ask, final['assets_ASK']) - final['basis_ASK'])
             tax_ask = self.tax_engine.capital_gains_tax(ask_gain)
         if realize_brokerage>0:
             br_balance = final['assets_brokerage']
-            br_contrib_share = total_contrib * (br_balance/total_assets) if total_assets>0 else 0
-            br_gain = max(0.0, min(realize_brokerage, br_balance) - br_contrib_share)
+            amount = min(realize_brokerage, br_balance)
+            if lots is not None and len(lots):
+                br_gain = lots.taxable_gain(amount, br_balance / lots.units.sum(), method)
+            else:
+                br_gain = amount * (1 - final['basis_brokerage'] / br_balance) if br_balance>0 else 0.0
             tax_brokerage = self.tax_engine.capital_gains_tax(br_gain)
         if realize_ips_withdraw>0:
             tax_ips = self.tax_engine.income_tax(realize_ips_withdraw)
@@ -90,6 +625,7 @@ class Simulation:
         results['total_tax_on_realization'] = tax_ask + tax_brokerage + tax_ips
         results['total_gain'] = total_gain
         return results
-    def format_table(self, df: pd.DataFrame, maxrows: int = 10) -> str:
+    def format_table(self, df: 'pd.DataFrame', maxrows: int = 10) -> str:
+        from tabulate import tabulate
         head = df.head(maxrows)
         return tabulate(head, headers='keys', tablefmt='psql', floatfmt=".0f")
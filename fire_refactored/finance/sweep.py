@@ -0,0 +1,85 @@
+"""Grid search over Person, Loan and TaxConfig parameters.
+
+Every combination of the grid is projected once with the swept values stacked along a
+leading batch axis; swept TaxConfig fields enter the taxes as per-row parameters. Large grids are split into chunks that run in a
+ProcessPoolExecutor, one batched chunk per task.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields, replace
+from itertools import repeat
+from typing import Dict, Sequence, Optional
+import numpy as np
+import pandas as pd
+from .models import Person, as_series
+from .tax import TaxConfig, TaxEngine, RATE_FIELDS
+from .loans import amortize_many
+from .simulation import Simulation, _first_year_reached, _holdings, _projection_inputs, _salary_path
+
+PERSON_PARAMS = ('salary', 'salary_growth', 'savings_rate', 'expenses')
+OTHER_PARAMS = ('annual_return', 'loan_extra_payment', 'inflation')
+TAX_PARAMS = tuple(f.name for f in fields(TaxConfig) if f.type is float)
+
+def _grid_columns(grid: Dict[str, Sequence]) -> Dict[str, np.ndarray]:
+    unknown = set(grid) - set(PERSON_PARAMS + OTHER_PARAMS + TAX_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    mesh = np.meshgrid(*[np.asarray(v, dtype=float) for v in grid.values()], indexing='ij')
+    return {k: m.ravel() for k, m in zip(grid, mesh)}
+
+def _evaluate(person: Person, params: Dict[str, np.ndarray], years: int, inflation: float,
+              tax_config: TaxConfig, withdrawal_rate: float) -> pd.DataFrame:
+    n = len(next(iter(params.values()))) if params else 1
+    def column(name, default):
+        # (n, 1) for swept or constant values, (n, years) for a time-varying default
+        if name in params:
+            return params[name][:, None]
+        value = as_series(default, years)
+        return np.broadcast_to(value, (n, value.shape[-1] if value.ndim else 1))
+    salary = _salary_path(person, years, column('salary', person.salary), column('salary_growth', person.salary_growth))
+    returns = None
+    if 'annual_return' in params:
+        returns = np.broadcast_to(params['annual_return'][:, None, None], (n, years, len(_holdings(person).principal)))
+    debt = None
+    if 'loan_extra_payment' in params:
+        # every (extra payment, loan) pair amortized in one batch
+        extras, inverse = np.unique(params['loan_extra_payment'], return_inverse=True)
+        if person.loans:
+            schedules = amortize_many([replace(loan, extra_payment=e) for e in extras for loan in person.loans])
+            paths = schedules.yearly_balance(years).reshape(len(extras), len(person.loans), years).sum(axis=1)
+        else:
+            paths = np.zeros((len(extras), years))
+        debt = paths[inverse.ravel()]
+    inputs = _projection_inputs(person, years, inflation=column('inflation', inflation), salary=salary,
+                                savings_rate=column('savings_rate', person.savings_rate), returns=returns, debt=debt)
+    # tax fields only change the taxes: one projection, with swept fields as (n, 1) tax parameters
+    tax = {**TaxEngine(tax_config)._params, **{k: params[k][:, None] for k in RATE_FIELDS if k in params}}
+    limit = lambda name: params[name][:, None] if name in params else getattr(tax_config, name)
+    deductions = (np.minimum(person.ips_contribution, limit('ips_contribution_limit'))
+                  + np.minimum(person.charity_donation, limit('charity_deduction_limit')))
+    cols = Simulation(tax_config)._rows(_holdings(person), deductions, inputs, engine=TaxEngine.per_period(tax_config, tax))[0]
+    final = {k: cols[k][:, -1] for k in ('total_assets', 'debt', 'net_wealth', 'real_net_wealth', 'cumulative_contrib')}
+    final.update(total_income_tax=cols['income_tax'].sum(axis=1), total_wealth_tax=cols['wealth_tax'].sum(axis=1))
+    years_to_fire = _first_year_reached(cols['real_net_wealth'], column('expenses', person.expenses) / withdrawal_rate)
+    return pd.DataFrame({**params, **final, 'years_to_fire': years_to_fire})
+
+def parameter_sweep(person: Person, grid: Dict[str, Sequence], years: int = 30, inflation: float = 0.02,
+                    tax_config: Optional[TaxConfig] = None, withdrawal_rate: float = 0.04,
+                    max_workers: Optional[int] = None, chunk_size: int = 5000) -> pd.DataFrame:
+    """Project every combination of grid values; one row per combination.
+
+    Grid keys are Person fields (PERSON_PARAMS), 'annual_return' (applied to every holding),
+    'loan_extra_payment' (monthly, applied to every loan), 'inflation' or float TaxConfig fields.
+    Grids larger than chunk_size are evaluated in a process pool; max_workers=1 keeps it in-process.
+    An empty grid projects the person as given.
+    """
+    params = _grid_columns(grid)
+    tax_config = tax_config or TaxConfig()
+    # an empty grid is one row of the person's own (possibly time-varying) inputs
+    n = len(next(iter(params.values()))) if params else 1
+    chunks = [{k: v[i:i+chunk_size] for k, v in params.items()} for i in range(0, n, chunk_size)]
+    if max_workers == 1 or len(chunks) == 1:
+        frames = [_evaluate(person, c, years, inflation, tax_config, withdrawal_rate) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            frames = list(pool.map(_evaluate, repeat(person), chunks, repeat(years), repeat(inflation), repeat(tax_config), repeat(withdrawal_rate)))
+    return pd.concat(frames, ignore_index=True)
@@ -1,46 +1,95 @@
-from dataclasses import dataclass, field
-from typing import List
-@dataclass
+from dataclasses import dataclass
+from typing import Dict, Tuple
+import numpy as np
+@dataclass(frozen=True)
 class TaxConfig:
+    """One set of tax rules. Frozen, so engines built from it never go stale; derive variants with dataclasses.replace."""
     ordinary_tax_rate: float = 0.22
     social_security_rate: float = 0.079
-    bracket_thresholds: List[float] = field(default_factory=lambda: [217400, 306050, 697150, 942400, 1410750])
-    bracket_rates: List[float] = field(default_factory=lambda: [0.0, 0.017, 0.04, 0.137, 0.167, 0.177])
+    bracket_thresholds: Tuple[float, ...] = (217400, 306050, 697150, 942400, 1410750)
+    bracket_rates: Tuple[float, ...] = (0.0, 0.017, 0.04, 0.137, 0.167, 0.177)
     wealth_threshold_single: float = 1760000.0
     wealth_state_rate: float = 0.00475
     wealth_state_rate_high: float = 0.00575
+    # net wealth above which wealth_state_rate_high applies (when is_high)
+    wealth_high_threshold: float = 20700000.0
     municipal_wealth_rate: float = 0.0075
     capital_gains_tax_rate: float = 0.22
     ips_contribution_limit: float = 15000.0
     charity_deduction_limit: float = 50000.0
+    def __post_init__(self):
+        # brackets given as lists are stored as tuples, so no field can change in place
+        object.__setattr__(self, 'bracket_thresholds', tuple(self.bracket_thresholds))
+        object.__setattr__(self, 'bracket_rates', tuple(self.bracket_rates))
+
+def _like(value, result: np.ndarray):
+    # scalar in -> float out, array in -> array out
+    return float(result) if np.ndim(value) == 0 else result
+
+# TaxConfig fields that are one number per rule set
+RATE_FIELDS = ('ordinary_tax_rate', 'social_security_rate', 'wealth_threshold_single', 'wealth_state_rate', 'wealth_state_rate_high',
+               'wealth_high_threshold', 'municipal_wealth_rate', 'capital_gains_tax_rate')
+
+def compile_brackets(thresholds, rates) -> Dict[str, np.ndarray]:
+    """Lower bound, rate, width and tax accumulated below each bracket."""
+    rates = np.asarray(rates, dtype=float)
+    lowers = np.concatenate([[0.0], np.asarray(thresholds, dtype=float)])[:len(rates)]
+    widths = np.append(np.diff(lowers), np.inf) if len(rates) else np.zeros(0)
+    base = np.concatenate([[0.0], np.cumsum(np.diff(lowers) * rates[:-1])]) if len(rates) else np.zeros(0)
+    return {'lowers': lowers, 'rates': rates, 'widths': widths, 'base': base}
 
 class TaxEngine:
+    """Tax rules from a TaxConfig; every method accepts scalars or NumPy arrays of any shape.
+
+    An engine from TaxEngine.per_period holds one rule set per period instead: each parameter is
+    an array over periods, and inputs must have the periods on their last axis. Leading axes of
+    the parameters (e.g. bumped scenarios) broadcast against the inputs' leading axes.
+    """
     def __init__(self, config: TaxConfig):
         self.cfg = config
-    def bracket_tax(self, personal_income: float) -> float:
-        thresholds = [0] + self.cfg.bracket_thresholds + [float('inf')]
-        rates = self.cfg.bracket_rates
-        tax = 0.0
-        for i in range(len(rates)):
-            lower = thresholds[i]
-            upper = thresholds[i+1]
-            if personal_income <= lower:
-                break
-            taxable = max(0.0, min(personal_income, upper) - lower)
-            tax += taxable * rates[i]
-        return tax
-    def income_tax(self, personal_income: float, deductions: float = 0.0) -> float:
-        taxable_income = max(0.0, personal_income - deductions)
-        ordinary = taxable_income * self.cfg.ordinary_tax_rate
-        ss = personal_income * self.cfg.social_security_rate
+    @property
+    def cfg(self) -> TaxConfig:
+        return self._cfg
+    @cfg.setter
+    def cfg(self, config: TaxConfig) -> None:
+        # the config is frozen, so assigning a new one is the only change to recompile for
+        self._cfg = config
+        self._params = {k: float(getattr(config, k)) for k in RATE_FIELDS}
+        self._params.update(compile_brackets(config.bracket_thresholds, config.bracket_rates))
+    @classmethod
+    def per_period(cls, config: TaxConfig, params: Dict[str, np.ndarray]) -> 'TaxEngine':
+        """Engine over compiled per-period parameters (RATE_FIELDS as (periods,), brackets as (periods, n_brackets))."""
+        engine = cls.__new__(cls)
+        engine._cfg = config
+        engine._params = params
+        return engine
+    def bracket_tax(self, personal_income):
+        income = np.maximum(0.0, np.asarray(personal_income, dtype=float))
+        p = self._params
+        if p['rates'].shape[-1] == 0:
+            return _like(personal_income, np.zeros_like(income))
+        if p['rates'].ndim >= 2:
+            # per-period (or per-scenario) brackets: the tax in every bracket, summed
+            tax = (p['rates'] * np.clip(income[..., None] - p['lowers'], 0.0, p['widths'])).sum(axis=-1)
+            return _like(personal_income, tax)
+        idx = np.searchsorted(p['lowers'], income, side='right') - 1
+        tax = p['base'][idx] + (income - p['lowers'][idx]) * p['rates'][idx]
+        return _like(personal_income, tax)
+    def income_tax(self, personal_income, deductions=0.0):
+        income = np.asarray(personal_income, dtype=float)
+        taxable_income = np.maximum(0.0, income - deductions)
+        ordinary = taxable_income * self._params['ordinary_tax_rate']
+        ss = income * self._params['social_security_rate']
         bracket = self.bracket_tax(taxable_income)
-        return ordinary + ss + bracket
-    def wealth_tax(self, net_wealth: float, is_high=False) -> float:
-        base = max(0.0, net_wealth - self.cfg.wealth_threshold_single)
-        state_rate = self.cfg.wealth_state_rate_high if (is_high and net_wealth>20_700_000) else self.cfg.wealth_state_rate
-        return base * (state_rate + self.cfg.municipal_wealth_rate)
-    def capital_gains_tax(self, gain: float) -> float:
-        return max(0.0, gain) * self.cfg.capital_gains_tax_rate
-    def net_salary(self, gross_salary: float, deductions: float = 0.0) -> float:
+        return _like(np.broadcast(personal_income, deductions), ordinary + ss + bracket)
+    def wealth_tax(self, net_wealth, is_high=False):
+        p = self._params
+        wealth = np.asarray(net_wealth, dtype=float)
+        base = np.maximum(0.0, wealth - p['wealth_threshold_single'])
+        state_rate = np.where(np.logical_and(is_high, wealth > p['wealth_high_threshold']), p['wealth_state_rate_high'], p['wealth_state_rate'])
+        return _like(np.broadcast(net_wealth, is_high), base * (state_rate + p['municipal_wealth_rate']))
+    def capital_gains_tax(self, gain):
+        return _like(gain, np.maximum(0.0, np.asarray(gain, dtype=float)) * self._params['capital_gains_tax_rate'])
+    def net_salary(self, gross_salary, deductions=0.0):
         income_tax = self.income_tax(gross_salary, deductions=deductions)
         return gross_salary - income_tax
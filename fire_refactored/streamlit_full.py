@@ -1,41 +1,45 @@
 """
 Full Streamlit app with account-type realism (ASK/IPS), brutto/netto, deductions, inflation,
-Plotly visualizations, tabulate formatted tables, multiple strategies and Excel export.
+Plotly visualizations, tabulate formatted tables, multiple strategies and Parquet/Excel export.
+Heavy work (config parsing, projections, figures, Excel bytes) is cached on a stable hash of
+the inputs, so a rerun only recomputes what its changed inputs touch.
 Run: streamlit run streamlit_full.py
 """
 import streamlit as st
-import pandas as pd, numpy as np, io, yaml, os
+import pandas as pd, numpy as np, os, json
 import plotly.graph_objects as go
-from finance.models import Person, Loan, Investment
-from finance.simulation import Simulation
-from finance.tax import TaxConfig
+from finance.models import Person, Loan, Investment, Household
+from finance.simulation import Simulation, monthly_to_yearly
+from finance.rules import load_rules, config_from_file
+from finance.cache import ResultCache, stable_hash
+from finance.export import excel_summary, to_parquet_bytes
+from finance.optimize import optimize_allocation
+from finance.profiling import Profiler
 from datetime import datetime
+from contextlib import nullcontext
 from tabulate import tabulate
 
 st.set_page_config(page_title="FIRE Simulator — Advanced", layout="wide")
 st.title("FIRE Simulator — Advanced (ASK, IPS, Deductions, Inflation)")
 
-def load_config(path="config_example.yaml"):
+@st.cache_data
+def load_custom_tax_config(path, mtime=None):
+    # mtime is part of the cache key so edits to the file are picked up
+    return config_from_file(path)
+
+# Tax rules: the shipped tables switch per projection year; a custom table replaces them
+rules = load_rules("NO")
+st.sidebar.header("Tax rules")
+tax_year = st.sidebar.selectbox("Tax year of projection year 1", list(rules.years), index=len(rules.years) - 1)
+indexation = st.sidebar.number_input("Yearly threshold indexation after the last table (decimal)", 0.0, step=0.005)
+custom_path = st.sidebar.text_input("Custom tax table (YAML/JSON, optional)", "")
+custom_cfg = None
+if custom_path:
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
-    except:
-        return {}
-
-cfg = load_config("config_example.yaml")
-tax_cfg = TaxConfig(
-    ordinary_tax_rate=cfg.get("ordinary_tax_rate", 0.22),
-    social_security_rate=cfg.get("social_security_rate", 0.079),
-    bracket_thresholds=cfg.get("bracket_thresholds", []),
-    bracket_rates=cfg.get("bracket_rates", []),
-    wealth_threshold_single=cfg.get("wealth_threshold_single", 1760000),
-    wealth_state_rate=cfg.get("wealth_state_rate", 0.00475),
-    wealth_state_rate_high=cfg.get("wealth_state_rate_high", 0.00575),
-    municipal_wealth_rate=cfg.get("municipal_wealth_rate", 0.0075),
-    capital_gains_tax_rate=cfg.get("capital_gains_tax_rate", 0.22),
-    ips_contribution_limit=cfg.get("ips_contribution_limit", 15000),
-    charity_deduction_limit=cfg.get("charity_deduction_limit", 50000)
-)
+        custom_cfg = load_custom_tax_config(custom_path, os.path.getmtime(custom_path))
+    except (OSError, ValueError) as exc:
+        st.sidebar.error(f"Could not use {custom_path}: {exc}. Using the {tax_year} rules instead.")
+tax_cfg = custom_cfg or rules.config(tax_year)
 
 # Sidebar controls
 st.sidebar.header("Simulation controls")
@@ -43,6 +47,7 @@ years = st.sidebar.slider("Projection years", 1, 60, 30)
 monthly = st.sidebar.checkbox("Monthly simulation (vs yearly)", value=False)
 inflation = st.sidebar.number_input("Annual inflation (decimal)", 0.02, step=0.001)
 compare = st.sidebar.checkbox("Compare strategy/scenario B", value=False)
+show_performance = st.sidebar.checkbox("Show performance panel", value=False)
 
 # Strategy presets
 st.sidebar.header("Strategy presets")
@@ -63,6 +68,9 @@ savings_rate = st.slider("Base savings rate (fraction)", 0.0, 1.0, 0.2, key="sav
 expenses = st.number_input("Annual expenses (NOK)", 240000.0, step=1000.0, key="expA")
 charity = st.number_input("Annual charity donations (deductible)", 0.0, step=1000.0, key="charityA")
 ips = st.number_input("Annual IPS contribution (deductible up to cap)", 0.0, step=1000.0, key="ipsA")
+retirement_year = st.number_input("Retirement year (0 = works throughout)", 0, 60, 0, key="retireA")
+lump_year = st.number_input("Lump-sum contribution year", 1, 60, 15, key="lumpyA")
+lump_amount = st.number_input("Lump-sum contribution (NOK)", 0.0, step=10000.0, key="lumpA")
 
 # Investments - allow multiple and select account type
 st.subheader("Investments (Scenario A)")
@@ -84,13 +92,16 @@ for i in range(int(n_loan)):
     lp = st.number_input(f"Loan principal {i}", 0.0, step=1000.0, key=f"loanpA_{i}")
     lr = st.number_input(f"Loan rate {i}", 0.03, step=0.0001, key=f"loanrA_{i}")
     ly = st.number_input(f"Loan years {i}", 20, step=1, key=f"loanyA_{i}")
+    lk = st.selectbox(f"Loan type {i}", ["annuity", "serial"], key=f"loankA_{i}")
+    lx = st.number_input(f"Extra monthly payment {i}", 0.0, step=500.0, key=f"loanxA_{i}")
     if lp>0:
-        loans.append({'principal':lp, 'rate':lr, 'years':int(ly)})
+        loans.append({'principal':lp, 'rate':lr, 'years':int(ly), 'kind':lk, 'extra':lx})
 
 from finance.models import Person, Loan as LoanClass, Investment as InvClass
-personA = Person(name=name, salary=salary, savings_rate=min(1.0, savings_rate+extra_savings_pct), expenses=expenses, charity_donation=charity, ips_contribution=ips)
+personA = Person(name=name, salary=salary, savings_rate=min(1.0, savings_rate+extra_savings_pct), expenses=expenses, charity_donation=charity, ips_contribution=ips,
+                 retirement_year=int(retirement_year) or None, lump_sums={int(lump_year): lump_amount} if lump_amount > 0 else {})
 personA.investments = investments
-personA.loans = [LoanClass(principal=l['principal'], annual_rate=l['rate'], years=l['years']) for l in loans]
+personA.loans = [LoanClass(principal=l['principal'], annual_rate=l['rate'], years=l['years'], kind=l['kind'], extra_payment=l['extra']) for l in loans]
 
 # Scenario B
 personB = None
@@ -106,38 +117,89 @@ if compare:
     invB = InvClass(principal=pB, annual_return=rB, account_type=acctB)
     personB = Person(name=nameB, salary=salaryB, savings_rate=savings_rateB, expenses=expensesB)
     personB.investments = [invB]
+    household = st.checkbox("Project A and B as one household (shared loan, taxed per person)", value=False, key="household")
+    shared_principal = st.number_input("Shared loan principal", 0.0, step=10000.0, key="sharedp") if household else 0.0
+    shared_rate = st.number_input("Shared loan rate", 0.04, step=0.0001, key="sharedr") if household else 0.04
+    shared_years = st.number_input("Shared loan years", 1, 40, 25, key="sharedy") if household else 25
+    share_A = st.slider("Share of shared loan held by A", 0.0, 1.0, 0.5, key="shareA") if household else 0.5
+
+@st.cache_resource
+def result_cache():
+    return ResultCache(max_bytes=128 * 2**20)
+
+@st.cache_resource
+def simulation(tax_key, _tax_cfg, _rules, start_year, indexation):
+    return Simulation(_tax_cfg, cache=result_cache(), rules=_rules, start_year=start_year, indexation=indexation)
+
+@st.cache_data(max_entries=64)
+def wealth_figure(keyA, keyB, _dfA, _dfB):
+    x = _dfA['year']
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=x, y=_dfA['total_assets'], name='Total assets', mode='lines'))
+    fig.add_trace(go.Scatter(x=x, y=_dfA['net_wealth'], name='Net wealth', mode='lines'))
+    fig.add_trace(go.Scatter(x=x, y=_dfA['real_net_wealth'], name='Real net wealth (inflation adj)', mode='lines', line=dict(dash='dot')))
+    if _dfB is not None:
+        fig.add_trace(go.Scatter(x=x, y=_dfB['net_wealth'], name='Scenario B net wealth', mode='lines'))
+    fig.update_layout(title="Assets & Net Wealth over time", xaxis_title="Year", yaxis_title="NOK", hovermode='x unified')
+    return fig
 
-sim = Simulation(tax_cfg)
+@st.cache_data(max_entries=64)
+def accounts_figure(keyA, _dfA):
+    x = _dfA['year']
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=x, y=_dfA['assets_brokerage'], name='Brokerage'))
+    fig.add_trace(go.Bar(x=x, y=_dfA['assets_ASK'], name='ASK'))
+    fig.add_trace(go.Bar(x=x, y=_dfA['assets_IPS'], name='IPS'))
+    fig.update_layout(barmode='stack', title="Assets by account type", xaxis_title="Year", yaxis_title="NOK")
+    return fig
+
+@st.cache_data(max_entries=16)
+def excel_report(keyA, _df_year):
+    return excel_summary({'Yearly': _df_year})
+
+@st.cache_data(max_entries=16)
+def parquet_report(keyA, _df_year):
+    return to_parquet_bytes(_df_year)
+
+sim_rules = None if custom_cfg else rules
+sim = simulation(stable_hash(tax_cfg, custom_path, tax_year, indexation), tax_cfg, sim_rules, tax_year, indexation)
 st.header("Simulation results")
 col1, col2 = st.columns([2,1])
 
-dfA = sim.project_yearly(personA, years=years, inflation=inflation)
-if compare and personB:
-    dfB = sim.project_yearly(personB, years=years, inflation=inflation)
-else:
-    dfB = None
+def project(person, key, slot):
+    # exact repeats come from the result cache; anything else resumes the scenario's last
+    # projection from the first year the edit changes
+    def compute():
+        checkpoint = sim.project_incremental(person, years=years, inflation=inflation, monthly=monthly, previous=st.session_state.get(slot))
+        st.session_state[slot] = checkpoint
+        return monthly_to_yearly(checkpoint.frame) if monthly else checkpoint.frame
+    return sim.cache.get_or_compute(key, compute)
+
+# the projections of this rerun are timed per stage when the performance panel is on
+with Profiler() if show_performance else nullcontext() as profiler:
+    keyA = stable_hash(personA, tax_cfg, sim._rules_key, years, inflation, monthly)
+    dfA = project(personA, keyA, "checkpoint_A")
+    if compare and personB:
+        keyB = stable_hash(personB, tax_cfg, sim._rules_key, years, inflation, monthly)
+        dfB = project(personB, keyB, "checkpoint_B")
+    else:
+        keyB, dfB = None, None
+    dfH = None
+    if compare and personB and household:
+        shared = [Loan(principal=shared_principal, annual_rate=shared_rate, years=int(shared_years))] if shared_principal > 0 else []
+        dfH = sim.project_household(Household(name="household", members=[personA, personB], shared_loans=shared, debt_shares=[share_A, 1 - share_A]),
+                                    years=years, inflation=inflation)
 
 with col1:
-    x = dfA['year']
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=x, y=dfA['total_assets'], name='Total assets', mode='lines'))
-    fig.add_trace(go.Scatter(x=x, y=dfA['net_wealth'], name='Net wealth', mode='lines'))
-    fig.add_trace(go.Scatter(x=x, y=dfA['real_net_wealth'], name='Real net wealth (inflation adj)', mode='lines', line=dict(dash='dot')))
-    if dfB is not None:
-        fig.add_trace(go.Scatter(x=x, y=dfB['net_wealth'], name='Scenario B net wealth', mode='lines'))
-    fig.update_layout(title="Assets & Net Wealth over time", xaxis_title="Year", yaxis_title="NOK", hovermode='x unified')
-    st.plotly_chart(fig, use_container_width=True)
-
-    fig2 = go.Figure()
-    fig2.add_trace(go.Bar(x=x, y=dfA['assets_brokerage'], name='Brokerage'))
-    fig2.add_trace(go.Bar(x=x, y=dfA['assets_ASK'], name='ASK'))
-    fig2.add_trace(go.Bar(x=x, y=dfA['assets_IPS'], name='IPS'))
-    fig2.update_layout(barmode='stack', title="Assets by account type", xaxis_title="Year", yaxis_title="NOK")
-    st.plotly_chart(fig2, use_container_width=True)
+    st.plotly_chart(wealth_figure(keyA, keyB, dfA, dfB), use_container_width=True)
+    st.plotly_chart(accounts_figure(keyA, dfA), use_container_width=True)
 
     st.subheader("Yearly table (first 10 rows)")
     st.text(sim.format_table(dfA, maxrows=10))
     st.dataframe(dfA.head(20))
+    if dfH is not None:
+        st.subheader("Household (yearly)")
+        st.dataframe(dfH.head(20))
 
     st.subheader("Realize and tax (estimate)")
     realize_ask = st.number_input("Withdraw from ASK (NOK)", 0.0, step=1000.0, key="realask")
@@ -147,21 +209,47 @@ with col1:
         res = sim.realize_and_tax(dfA, realize_ask=realize_ask, realize_brokerage=realize_bro, realize_ips_withdraw=realize_ips)
         st.json(res)
 
-    def to_excel_bytes(df_year=None, path='fire_report.xlsx'):
-        import pandas as pd, io
-        with io.BytesIO() as buffer:
-            with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                if df_year is not None:
-                    df_year.to_excel(writer, sheet_name='Yearly', index=False)
-            return buffer.getvalue()
-    excel_bytes = to_excel_bytes(df_year=dfA)
-    st.download_button("Download Excel report (Yearly)", data=excel_bytes, file_name="fire_report.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    st.subheader("Optimize savings allocation (Scenario A)")
+    goal = st.selectbox("Goal", ["Maximize after-tax real wealth", "Reach FIRE soonest"], key="optgoal")
+    if st.button("Find best split of savings across IPS/ASK/brokerage and loan paydown"):
+        res = optimize_allocation(personA, years=years, objective="wealth" if goal.startswith("Maximize") else "fire", inflation=inflation, tax_config=tax_cfg)
+        st.write("Best split vs your current one (IPS and extra loan payments in NOK, ASK share of the rest):")
+        st.dataframe(pd.DataFrame([res["best"], res["current"]], index=["best", "current"]))
+        st.dataframe(res["table"].head(10))
+
+    st.subheader("Sensitivities (Scenario A)")
+    metric = st.selectbox("Metric", ["net_wealth", "real_net_wealth", "years_to_fire", "total_tax"], key="sensmetric")
+    if st.button("Compute tornado chart"):
+        tab = sim.sensitivities(personA, years=years, inflation=inflation)
+        tab = tab[(tab["metric"] == metric) & (tab["swing"] > 0)].head(12).iloc[::-1]
+        base = tab["base"].iloc[0] if len(tab) else 0.0
+        fig = go.Figure([go.Bar(y=tab["parameter"], x=tab[k] - base, base=base, orientation="h", name=f"{k} (±1%)") for k in ("low", "high")])
+        fig.update_layout(barmode="overlay", title=f"{metric} around {base:,.1f}")
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(tab.iloc[::-1])
+
+    # the workbook is only built once requested, and then only again when scenario A changes
+    if st.button("Prepare Excel report"):
+        st.session_state["excel_key"] = keyA
+    if st.session_state.get("excel_key") == keyA:
+        st.download_button("Download Excel report (Yearly)", data=excel_report(keyA, dfA), file_name="fire_report.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    st.download_button("Download Parquet (Yearly)", data=parquet_report(keyA, dfA), file_name="fire_projection.parquet", mime="application/vnd.apache.parquet")
 
 with col2:
     st.subheader("Summary metrics")
     st.metric("Start total assets", f"{dfA['total_assets'].iloc[0]:,.0f}")
     st.metric("Start net wealth", f"{dfA['net_wealth'].iloc[0]:,.0f}")
     st.metric("End net wealth (year {y})".format(y=years), f"{dfA['net_wealth'].iloc[-1]:,.0f}")
+    if dfH is not None:
+        st.metric("Household end net wealth", f"{dfH['net_wealth'].iloc[-1]:,.0f}")
+        st.metric("Household total wealth tax", f"{dfH['wealth_tax'].sum():,.0f}")
+    st.caption("Result cache: {hits} hits, {misses} misses, {entries} entries".format(**sim.cache.stats()))
+    if profiler is not None:
+        st.subheader("Performance (this rerun)")
+        timings = profiler.to_dict()
+        st.caption(f"Projections took {timings['wall_ms']:.2f} ms; cache hits skip every stage below.")
+        st.dataframe(pd.DataFrame.from_dict(timings["stages"], orient="index"))
+        st.download_button("Download Chrome trace", data=json.dumps(profiler.chrome_trace()), file_name="fire_trace.json", mime="application/json")
 
 st.markdown("---")
-st.caption("This advanced prototype models ASK/IPS behavior (simplified), deductions, inflation, and provides tax estimates on realization. Update config_example.yaml to match current tax rules.")
+st.caption("This advanced prototype models ASK/IPS behavior (simplified), deductions, inflation, and provides tax estimates on realization. Tax tables live in finance/rules/<jurisdiction>/<year>.json; config_example.yaml shows the format of a custom table.")
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 from finance.loans import annuity_payment
 from finance.tax import TaxConfig, TaxEngine
 
@@ -10,3 +11,478 @@ def test_tax_engine():
     cfg=TaxConfig()
     te=TaxEngine(cfg)
     assert te.income_tax(500000)>0
+
+def test_tax_rules_cannot_go_stale():
+    from dataclasses import FrozenInstanceError, replace
+    from finance import Simulation
+    te=TaxEngine(TaxConfig(bracket_thresholds=[100000]))
+    assert te.cfg.bracket_thresholds==(100000,)
+    with pytest.raises(FrozenInstanceError):
+        te.cfg.ordinary_tax_rate=0.5
+    te.cfg=replace(te.cfg,ordinary_tax_rate=0.5,bracket_thresholds=[],bracket_rates=[])
+    assert te.income_tax(100000)==pytest.approx(100000*(0.5+0.079))
+    sim=Simulation()
+    sim.cfg=replace(sim.cfg,capital_gains_tax_rate=0.3)
+    assert sim.tax_engine.capital_gains_tax(100.0)==pytest.approx(30.0)
+
+def test_monte_carlo_zero_volatility_matches_yearly():
+    from finance import Person, Investment, Simulation
+    p=Person('a',600000,0.2,240000,investments=[Investment(100000,0.06,0.0),Investment(50000,0.04,0.0,account_type='ASK')])
+    sim=Simulation()
+    mc=sim.project_monte_carlo(p,years=20,n_paths=3,seed=1)
+    df=sim.project_yearly(p,years=20)
+    assert np.allclose(mc['bands']['net_wealth_p50'],df['net_wealth'])
+    assert np.allclose(mc['bands']['net_wealth_p5'],mc['bands']['net_wealth_p95'])
+
+def test_monte_carlo_seeded_and_bounded():
+    from finance import Person, Investment, Simulation
+    p=Person('a',600000,0.2,240000,investments=[Investment(100000,0.06,0.2)])
+    sim=Simulation()
+    a=sim.project_monte_carlo(p,years=30,n_paths=500,seed=7)
+    b=sim.project_monte_carlo(p,years=30,n_paths=500,seed=7)
+    assert a['bands'].equals(b['bands'])
+    assert 0.0<=a['fire_probability']<=1.0
+    assert (a['bands']['net_wealth_p5']<=a['bands']['net_wealth_p95']).all()
+    assert a['bands']['fire_probability'].is_monotonic_increasing
+
+def test_amortize_matches_iterative_schedule():
+    from finance import Loan, amortize, annuity_payment
+    loan=Loan(principal=2_000_000,annual_rate=0.05,years=25)
+    sched=amortize(loan)
+    pay=annuity_payment(loan.principal,loan.annual_rate,loan.years)
+    bal=loan.principal
+    for m in range(loan.months()):
+        bal-=pay-bal*loan.monthly_rate()
+        assert sched.balance[m]==pytest.approx(max(bal,0.0),abs=1e-4)
+    assert sched.balance[-1]==pytest.approx(0.0,abs=1e-4)
+    assert sched.yearly_balance(30)[-5:].tolist()==[0.0]*5
+    assert sched.yearly_balance(2)[0]==pytest.approx(sched.balance[11])
+
+def test_serial_loans_extra_payments_and_holidays():
+    from finance import Loan, amortize, amortize_many
+    loan=Loan(2_000_000,0.05,20,kind='serial',extra_payment=1000,one_off_payments={'25':100000},payment_holidays=[13,14])
+    sched=amortize(loan)
+    bal,inst,r=loan.principal,loan.principal/240,0.05/12
+    for m in range(sched.months()):
+        interest=bal*r
+        bal=max(bal-(0 if m in (12,13) else inst)-1000-(100000 if m==24 else 0),0.0)
+        assert sched.balance[m]==pytest.approx(bal,abs=1e-4) and sched.interest[m]==pytest.approx(interest)
+    assert sched.principal[12]==pytest.approx(1000) and sched.balance[-1]==0.0 and sched.months()<242
+    annuity=Loan(2_000_000,0.05,20,payment_holidays=[1,2,3])
+    assert amortize(annuity).months()==243 and amortize(annuity).principal[:3]==pytest.approx([0.0]*3)
+    batch=amortize_many([loan,annuity,Loan(1e6,[0.03]*3+[0.06]*7,10,extra_payment=2000)])
+    assert all(np.allclose(batch.schedule(i).balance,amortize(l).balance) for i,l in enumerate([loan,annuity,Loan(1e6,[0.03]*3+[0.06]*7,10,extra_payment=2000)]))
+    assert batch.yearly_balance(30).shape==(3,30) and (batch.yearly_balance(30)[:,-1]==0).all()
+    with pytest.raises(ValueError):
+        Loan(1e6,0.05,20,kind='bullet')
+
+def test_projection_does_not_mutate_loans():
+    from finance import Person, Loan, Investment, Simulation
+    p=Person('a',600000,0.2,240000,loans=[Loan(1_000_000,0.04,20)],investments=[Investment(100000,0.06)])
+    sim=Simulation()
+    a=sim.project_yearly(p,years=25)
+    b=sim.project_yearly(p,years=25)
+    assert p.loans[0].principal==1_000_000
+    assert a.equals(b)
+    assert a['debt'].iloc[-1]==0.0
+
+def test_tax_engine_batches_arrays():
+    te=TaxEngine(TaxConfig())
+    incomes=np.array([[0.0,250000.0,800000.0],[1e6,2e6,-5.0]])
+    taxes=te.income_tax(incomes,deductions=15000)
+    assert taxes.shape==incomes.shape
+    assert all(taxes[i,j]==pytest.approx(te.income_tax(float(incomes[i,j]),deductions=15000)) for i in range(2) for j in range(3))
+    assert isinstance(te.bracket_tax(500000),float)
+    assert te.bracket_tax(306050)==pytest.approx((306050-217400)*0.017)
+    assert te.wealth_tax(np.array([0.0,2e6])).tolist()==[0.0,pytest.approx((2e6-1760000)*(0.00475+0.0075))]
+
+def test_project_yearly_matches_stepwise_loop():
+    from finance import Person, Investment, Simulation
+    p=Person('a',600000,0.25,240000,investments=[Investment(100000,0.07),Investment(40000,0.03,account_type='IPS')])
+    df=Simulation().project_yearly(p,years=15,inflation=0.03)
+    held=np.array([100000.0,40000.0])
+    for y in range(15):
+        held=(held+150000*np.array([100,40])/140)*np.array([1.07,1.03])
+        assert df[['assets_brokerage','assets_ASK','assets_IPS']].iloc[y].tolist()==pytest.approx([held[0],0.0,held[1]])
+    assert df['cumulative_contrib'].iloc[-1]==pytest.approx(15*150000)
+    assert df['real_net_wealth'].iloc[-1]==pytest.approx(df['net_wealth'].iloc[-1]/1.03**15)
+
+def test_project_monthly_downsamples_to_years():
+    from finance import Person, Loan, Investment, Simulation
+    p=Person('a',600000,0.2,240000,loans=[Loan(2e6,0.05,10)],investments=[Investment(100000,0.06)])
+    sim=Simulation()
+    m=sim.project_monthly(p,years=12)
+    y=sim.project_monthly(p,years=12,yearly=True)
+    assert len(m)==144 and len(y)==12
+    assert y['saved'].tolist()==pytest.approx([120000.0]*12)
+    assert y['debt'].tolist()==pytest.approx(sim.project_yearly(p,years=12)['debt'].tolist())
+    assert m['loan_payment'].iloc[:120].sum()==pytest.approx(m['loan_interest'].sum()+2e6)
+    assert m['loan_payment'].iloc[120:].sum()==0.0
+
+def test_parameter_sweep_matches_individual_projections():
+    from dataclasses import replace
+    from finance import Person, Loan, Investment, Simulation, parameter_sweep
+    p=Person('a',600000,0.2,240000,loans=[Loan(2e6,0.04,25)],investments=[Investment(100000,0.06),Investment(50000,0.04,account_type='ASK')])
+    grid={'savings_rate':[0.1,0.3],'annual_return':[0.04,0.07],'loan_extra_payment':[0.0,2000.0],'wealth_state_rate':[0.004,0.005]}
+    df=parameter_sweep(p,grid,years=20,chunk_size=5,max_workers=1)
+    assert len(df)==16
+    for row in df.itertuples():
+        q=replace(p,savings_rate=row.savings_rate,investments=[replace(i,annual_return=row.annual_return) for i in p.investments],
+                  loans=[replace(l,extra_payment=row.loan_extra_payment) for l in p.loans])
+        ref=Simulation(TaxConfig(wealth_state_rate=row.wealth_state_rate)).project_yearly(q,years=20)
+        assert row.net_wealth==pytest.approx(ref['net_wealth'].iloc[-1])
+        assert row.total_wealth_tax==pytest.approx(ref['wealth_tax'].sum())
+    q=replace(p,ips_contribution=10000)
+    taxed=parameter_sweep(q,{'ordinary_tax_rate':[0.2,0.3],'ips_contribution_limit':[5000.0,15000.0]},years=20)
+    for row in taxed.itertuples():
+        ref=Simulation(TaxConfig(ordinary_tax_rate=row.ordinary_tax_rate,ips_contribution_limit=row.ips_contribution_limit)).project_yearly(q,years=20)
+        assert row.total_income_tax==pytest.approx(ref['income_tax'].sum())
+    with pytest.raises(ValueError):
+        parameter_sweep(p,{'bogus':[1]})
+    path=replace(p,savings_rate=np.linspace(0.1,0.3,20))
+    one=parameter_sweep(path,{},years=20)
+    assert len(one)==1 and one['net_wealth'].iloc[0]==pytest.approx(Simulation().project_yearly(path,years=20)['net_wealth'].iloc[-1])
+
+def test_result_cache_hits_on_equal_inputs(tmp_path):
+    from finance import Person, Loan, Investment, Simulation, ResultCache, stable_hash
+    mk=lambda: Person('a',600000,0.2,240000,loans=[Loan(1e6,0.04,20)],investments=[Investment(100000,0.06)])
+    cache=ResultCache(path=str(tmp_path))
+    sim=Simulation(TaxConfig(),cache=cache)
+    a=sim.project_yearly(mk(),years=20)
+    b=sim.project_yearly(mk(),years=20)
+    assert a.equals(b) and cache.stats()['hits']==1 and cache.stats()['misses']==1
+    sim.project_yearly(mk(),years=21)
+    assert cache.stats()['misses']==2
+    assert stable_hash(Loan(1e6,0.04,20))==stable_hash(Loan(1000000,0.04,20.0))
+    fresh=ResultCache(path=str(tmp_path))
+    assert Simulation(TaxConfig(),cache=fresh).project_yearly(mk(),years=20).equals(a) and fresh.hits==1
+    small=ResultCache(max_bytes=a.memory_usage(deep=True).sum()+1)
+    small.put('x',a); small.put('y',a)
+    assert small.get('x') is None and small.get('y') is not None
+
+def test_result_cache_skips_callable_inputs():
+    from finance import Person, Simulation, ResultCache, stable_hash
+    sim=Simulation(TaxConfig(),cache=ResultCache())
+    gross=[sim.project_yearly(Person('a',lambda y,s=s: s+0*y,0.2,240000),years=5)['gross_salary'].iloc[0] for s in (600000,900000)]
+    assert gross==[600000,900000] and sim.cache.stats()['hits']==sim.cache.stats()['misses']==0
+    with pytest.raises(TypeError):
+        stable_hash(Person('a',lambda y: 600000+0*y,0.2,240000))
+
+def test_years_to_fire_and_required_savings_rate():
+    from finance import Person, Loan, Investment, Simulation
+    p=Person('a',600000,0.3,240000,loans=[Loan(2e6,0.04,25)],investments=[Investment(100000,0.06),Investment(50000,0.04,account_type='ASK')])
+    sim=Simulation()
+    df=sim.project_yearly(p,years=100)
+    assert sim.years_to_fire(p)==df['year'][df['real_net_wealth']>=240000/0.04].min()
+    summary=sim.summary(p,years=100)
+    assert summary['years_to_fire']==sim.years_to_fire(p) and summary['net_wealth']==pytest.approx(df['net_wealth'].iloc[-1])
+    assert summary['total_wealth_tax']==pytest.approx(df['wealth_tax'].sum()) and np.isnan(sim.summary(p,years=2)['years_to_fire'])
+    batch=sim.years_to_fire(p,withdrawal_rate=[0.03,0.04],savings_rate=[[0.1],[0.5]])
+    assert batch.shape==(2,2) and batch[1,1]<=batch[0,1] and batch[1,0]>=batch[1,1]
+    rate=sim.required_savings_rate(p,20)
+    assert sim.years_to_fire(p,savings_rate=rate+1e-9)<=20<sim.years_to_fire(p,savings_rate=rate-1e-6)
+    assert np.isnan(sim.required_savings_rate(p,2))
+
+def test_withdrawals_deplete_and_tax():
+    from finance import Person, Investment, WithdrawalStrategy, simulate_withdrawals, safe_withdrawal_rate
+    flat=Person('a',0,0,0,investments=[Investment(1e6,0.0,0.0)])
+    res=simulate_withdrawals(flat,WithdrawalStrategy(amount=100000),years=12,n_paths=4,inflation=0.0)
+    assert res['bands']['survival_probability'].tolist()==[1.0]*10+[0.0]*2
+    assert res['failure_probability']==1.0
+    gains=simulate_withdrawals(flat,WithdrawalStrategy(amount=100000),years=1,n_paths=1,inflation=0.0,basis={'brokerage':5e5})
+    assert gains['bands']['tax_p50'].iloc[0]==pytest.approx(50000*0.22)
+    with pytest.raises(ValueError):
+        WithdrawalStrategy('yolo')
+    p=Person('b',0,0,0,investments=[Investment(5e6,0.05,0.15),Investment(1e6,0.05,0.1,account_type='ASK')])
+    swr=safe_withdrawal_rate(p,years=30,n_paths=2000,seed=3)
+    assert swr['table']['success_probability'].is_monotonic_decreasing
+    assert simulate_withdrawals(p,WithdrawalStrategy(rate=swr['safe_withdrawal_rate']),years=30,n_paths=2000,seed=3)['failure_probability']<=0.05
+
+def test_benchmark_cases_run():
+    from benchmarks.bench_finance import cases
+    for name,fn in cases().items():
+        assert fn() is not None, name
+
+def test_lot_book_fifo_and_average():
+    from finance import LotBook
+    book=LotBook.from_contributions([100.0,0.0,100.0],[1.0,1.5,2.0])
+    assert len(book)==2 and book.units.tolist()==[100.0,50.0]
+    assert book.taxable_gain(300.0,3.0)==pytest.approx(200.0)
+    assert book.taxable_gain(300.0,3.0,method='average')==pytest.approx(300.0-300.0/450.0*200.0)
+    assert book.taxable_gain(np.array([0.0,450.0]),3.0).tolist()==pytest.approx([0.0,250.0])
+    gain,rest=book.realize(300.0,3.0)
+    assert gain==pytest.approx(200.0) and rest.units.tolist()==pytest.approx([0.0,50.0]) and rest.cost.sum()==pytest.approx(100.0)
+
+def test_projection_tracks_basis_per_account():
+    from finance import Person, Investment, Simulation
+    p=Person('a',600000,0.2,240000,investments=[Investment(100000,0.08),Investment(50000,0.02,account_type='ASK')])
+    sim=Simulation()
+    df=sim.project_yearly(p,years=20)
+    final=df.iloc[-1]
+    assert final['basis_brokerage']+final['basis_ASK']==pytest.approx(150000+final['cumulative_contrib'])
+    lots=sim.brokerage_lots(p,years=20)
+    assert lots.cost.sum()==pytest.approx(final['basis_brokerage'])
+    fifo=sim.realize_and_tax(df,realize_brokerage=500000,lots=lots)
+    avg=sim.realize_and_tax(df,realize_brokerage=500000)
+    assert fifo['tax_brokerage']>avg['tax_brokerage']>0
+    assert sim.realize_and_tax(df,realize_ask=final['basis_ASK'])['tax_ask']==0.0
+    monthly=sim.brokerage_lots(p,years=40,monthly=True)
+    assert len(monthly)==481 and monthly.cost.sum()==pytest.approx(sim.project_monthly(p,years=40)['basis_brokerage'].iloc[-1])
+
+def test_holdings_grow_individually():
+    from finance import Person, Investment, Simulation
+    p=Person('a',100000,0.0,0,investments=[Investment(1000,0.10),Investment(1000,0.0),Investment(500,0.05,account_type='ASK',contribution_weight=0.0)])
+    df=Simulation().project_yearly(p,years=2)
+    assert df['assets_brokerage'].tolist()==pytest.approx([2100.0,2210.0])
+    assert df['assets_ASK'].tolist()==pytest.approx([525.0,551.25])
+    q=Person('b',100000,0.5,0,investments=[Investment(1000,0.0,contribution_weight=1.0),Investment(1000,0.0,account_type='IPS',contribution_weight=3.0)])
+    df=Simulation().project_yearly(q,years=1)
+    assert (df['assets_brokerage'].iloc[0],df['assets_IPS'].iloc[0])==pytest.approx((13500.0,38500.0))
+
+def test_batch_runner_streams_rows_and_errors(tmp_path):
+    import csv
+    from finance import Person, Investment, Simulation
+    from finance.batch import read_scenarios, run_batch
+    src=tmp_path/'s.csv'
+    src.write_text('id,salary,savings_rate,expenses,investments,years\n'
+                   'a,600000,0.2,240000,"[{""principal"": 100000, ""annual_return"": 0.05}]",\n'
+                   'b,500000,0.3,200000,,10\n'
+                   'c,oops,0.3,200000,,\n')
+    out=tmp_path/'out.csv'
+    assert run_batch(read_scenarios(str(src)),str(out),workers=1,chunk_size=2,defaults={'years':20})==3
+    rows=list(csv.DictReader(open(out)))
+    assert [r['id'] for r in rows]==['a','b','c'] and [r['years'] for r in rows]==['20','10','']
+    assert rows[2]['error'].startswith('ValueError') and rows[0]['error']==''
+    expected=Simulation().project_yearly(Person('a',600000,0.2,240000,investments=[Investment(100000,0.05)]),years=20)
+    assert float(rows[0]['net_wealth'])==pytest.approx(expected['net_wealth'].iloc[-1])
+
+def test_parquet_export_names_the_extra_without_pyarrow(monkeypatch):
+    import sys
+    import pandas as pd
+    from finance.export import to_parquet_bytes
+    monkeypatch.setitem(sys.modules,'pyarrow',None)
+    with pytest.raises(ImportError,match=r'fire-simulator\[parquet\]'):
+        to_parquet_bytes(pd.DataFrame({'year':[1]}))
+
+def test_parquet_export_partitions_append_and_types(tmp_path):
+    from finance import Person, Loan, Investment, Simulation
+    from finance.export import export_projection, export_amortization, export_monte_carlo, read_table, read_frame
+    p=Person('a',600000,0.2,200000,loans=[Loan(1e6,0.05,10,name='house')],investments=[Investment(1e5,0.06)])
+    sim=Simulation()
+    df=sim.project_yearly(p,years=10)
+    export_projection(df,tmp_path,'1',float_dtype='float32')
+    export_projection(df,tmp_path,'1',append=True,float_dtype='float32')
+    export_projection(df,tmp_path,'b')
+    export_projection(df,tmp_path,'b')
+    t=read_table(tmp_path,'projection')
+    assert t.num_rows==30 and str(t.schema.field('net_wealth').type)=='double' and str(t.schema.field('year').type)=='int32'
+    assert read_frame(tmp_path,'projection','b')['net_wealth'].tolist()==df['net_wealth'].tolist()
+    assert len(read_frame(tmp_path,'projection','1'))==20
+    export_amortization(p.loans,tmp_path,'b')
+    assert read_frame(tmp_path,'amortization','b')['principal'].sum()==pytest.approx(1e6)
+    export_monte_carlo(sim.project_monte_carlo(p,years=10,n_paths=200,seed=0),tmp_path,'b')
+    cube=read_frame(tmp_path,'monte_carlo','b')
+    assert sorted(cube['percentile'].unique())==[5,50,95] and len(cube)==30
+
+def test_incremental_reprojection_matches_full_projection():
+    import pandas as pd
+    from dataclasses import replace
+    from finance import Person, Loan, Investment, Simulation
+    p=Person('a',600000,0.2,200000,loans=[Loan(2e6,0.04,25)],investments=[Investment(1e5,0.06),Investment(5e4,0.04,account_type='ASK')],salary_growth=0.02)
+    sim=Simulation()
+    for monthly in (False,True):
+        full=lambda q,y=40: sim.project_monthly(q,y) if monthly else sim.project_yearly(q,y)
+        cp=sim.project_incremental(p,40,monthly=monthly)
+        pd.testing.assert_frame_equal(cp.frame,full(p))
+        q=replace(p,lump_sums={15:500000},retirement_year=30)
+        cp2=sim.project_incremental(q,40,monthly=monthly,previous=cp)
+        assert cp.first_change(cp2.key,cp2.inputs)==(168 if monthly else 14)
+        pd.testing.assert_frame_equal(cp2.frame,full(q),check_exact=False,rtol=1e-12)
+        assert sim.project_incremental(q,40,monthly=monthly,previous=cp2) is cp2
+        pd.testing.assert_frame_equal(sim.project_incremental(q,50,monthly=monthly,previous=cp2).frame,full(q,50),check_exact=False,rtol=1e-12)
+    df=sim.project_yearly(replace(p,lump_sums={15:500000},retirement_year=30),40)
+    assert df['saved'].iloc[14]==pytest.approx(500000+0.2*600000*1.02**14) and (df['gross_salary'].iloc[29:]==0).all()
+
+def test_time_varying_inputs_broadcast_in_engine():
+    import pandas as pd
+    from dataclasses import replace
+    from finance import Person, Loan, Investment, Simulation, amortize
+    from finance.models import as_series
+    sim=Simulation()
+    p=Person('a',600000,0.2,250000,loans=[Loan(2e6,0.04,25)],investments=[Investment(1e5,0.06)],salary_growth=0.02)
+    flat=replace(p,salary=np.full(40,600000.0),savings_rate=np.full(40,0.2),expenses=np.full(40,250000.0),loans=[Loan(2e6,np.full(25,0.04),25)])
+    pd.testing.assert_frame_equal(sim.project_yearly(p,40),sim.project_yearly(flat,40,inflation=np.full(40,0.02)),rtol=1e-12)
+    pd.testing.assert_frame_equal(sim.project_monthly(p,40),sim.project_monthly(flat,40,inflation=np.full(40,0.02)),rtol=1e-12)
+    assert sim.years_to_fire(flat)==sim.years_to_fire(p)
+    path=np.linspace(0.1,0.3,40)
+    assert np.shares_memory(as_series(path,30),path)
+    q=replace(p,salary=lambda y: np.where(y>=10,700000.0,600000.0),savings_rate=(r for r in path),salary_growth=0.0,
+              loans=[Loan(2e6,[0.03]*5+[0.06]*20,25)])
+    df=sim.project_yearly(q,40,inflation=lambda y: np.where(y<=5,0.05,0.02))
+    assert df['gross_salary'].iloc[[8,9]].tolist()==[600000.0,700000.0] and df['saved'].iloc[-1]==pytest.approx(0.3*700000)
+    assert df['real_net_wealth'].iloc[6]==pytest.approx(df['net_wealth'].iloc[6]/(1.05**5*1.02**2))
+    s=amortize(q.loans[0])
+    assert s.payment[59]<s.payment[60] and s.balance[-1]==pytest.approx(0.0) and len(s.balance)==300
+
+def test_backtest_rolling_windows(tmp_path):
+    from finance import Person, Investment, Simulation
+    from finance.history import save_history, load_history, history_from_csv
+    rng=np.random.default_rng(1)
+    save_history(tmp_path/'h.npz',np.arange(1900,2000),rng.normal(0.07,0.15,100),rng.normal(0.03,0.05,100),rng.normal(0.02,0.02,100))
+    h=load_history(tmp_path/'h.npz')
+    (tmp_path/'h.csv').write_text('year,equity,bond,cpi\n2000,0.1,0.03,0.02\n2001,-0.1,0.04,0.01\n')
+    history_from_csv(tmp_path/'h.csv',tmp_path/'csv.npz')
+    assert load_history(tmp_path/'csv.npz')['equity'].tolist()==[0.1,-0.1]
+    with pytest.raises(FileNotFoundError,match='history_from_csv'):
+        load_history(tmp_path/'missing.npz')
+    p=Person('a',600000,0.25,250000,investments=[Investment(1e5,0.06),Investment(1e5,0.03,account_type='ASK')])
+    sim=Simulation()
+    res=sim.backtest(p,np.column_stack([h['equity'],h['bond']]),h['cpi'],years=30,start_year=int(h['year'][0]))
+    assert res['n_windows']==71 and res['table']['start_year'].iloc[-1]==1970
+    w=res['worst']
+    i=w['start_year']-1900
+    direct=sim._columns(p,30,h['cpi'][i:i+30],returns=np.column_stack([h['equity'],h['bond']])[i:i+30])['real_net_wealth'][-1]
+    assert w['final_real_net_wealth']==pytest.approx(direct)==res['table']['final_real_net_wealth'].min()
+    flat=sim.backtest(p,np.full(40,0.05),0.02,years=30)
+    assert flat['table']['final_real_net_wealth'].nunique()==1 and flat['success_rate'] in (0.0,1.0)
+    with pytest.raises(ValueError):
+        sim.backtest(p,np.full(10,0.05),years=30)
+
+def test_household_taxes_members_individually():
+    from finance import Person, Household, Loan, Investment, Simulation
+    from finance.simulation import _debt_path
+    a=Person('a',700000,0.2,250000,investments=[Investment(1e6,0.06),Investment(2e5,0.04,account_type='ASK')],loans=[Loan(5e5,0.04,20)])
+    b=Person('b',500000,0.1,200000,investments=[Investment(3e6,0.05)])
+    shared=[Loan(4e6,0.05,25)]
+    sim=Simulation()
+    df=sim.project_household(Household('ab',[a,b],shared_loans=shared,debt_shares=[0.6,0.4]),30)
+    for p,share in ((a,0.6),(b,0.4)):
+        solo=sim._columns(p,30,debt=_debt_path(p.loans,30)+share*_debt_path(shared,30))
+        assert np.allclose(df[f'wealth_tax_{p.name}'],solo['wealth_tax']) and np.allclose(df[f'net_wealth_{p.name}'],solo['net_wealth'])
+    assert np.allclose(df['wealth_tax'],df['wealth_tax_a']+df['wealth_tax_b'])
+    # once both are well above it, two thresholds beat one; early on a's negative net wealth cannot offset b's
+    pooled=sim.tax_engine.wealth_tax(df['net_wealth'].to_numpy())
+    assert df['wealth_tax'].iloc[-1]<pooled[-1] and df['wealth_tax'].iloc[1]>pooled[1]
+    with pytest.raises(ValueError):
+        Household('x',[a,b],debt_shares=[0.5,0.6]).shares()
+
+def test_tax_rule_registry_switches_tables_per_year(tmp_path):
+    import json, os
+    from dataclasses import FrozenInstanceError, asdict, replace
+    from finance import Person, Investment, Simulation, TaxConfig, TaxEngine
+    from finance.rules import RULES_DIR, load_rules, config_from_file, available_rules
+    rules=load_rules('NO')
+    assert rules is load_rules('NO') and {2024,2025}<=set(available_rules()['NO']) and rules.config(2030)==TaxConfig()
+    with pytest.raises(ValueError):
+        rules.arrays['rates'][0,0]=1.0
+    with pytest.raises(FrozenInstanceError):
+        rules.config(2024).ordinary_tax_rate=0.5
+    assert replace(rules.config(2024),ordinary_tax_rate=0.5).ordinary_tax_rate!=load_rules('NO').config(2024).ordinary_tax_rate
+    assert load_rules('NO').config(2024)==config_from_file(os.path.join(RULES_DIR,'NO','2024.json'))
+    p=Person('a',900000,0.2,250000,investments=[Investment(3e6,0.06)])
+    df=Simulation(rules=rules,start_year=2024,indexation=0.03).project_yearly(p,5)
+    gross,net=df['gross_salary'].to_numpy(),df['net_wealth'].to_numpy()
+    assert df['income_tax'].iloc[0]==pytest.approx(TaxEngine(rules.config(2024)).income_tax(gross[0]))
+    assert df['income_tax'].iloc[1]==pytest.approx(TaxEngine(rules.config(2025)).income_tax(gross[1]))
+    indexed=TaxConfig(**{**asdict(TaxConfig()),'bracket_thresholds':[t*1.03**2 for t in TaxConfig().bracket_thresholds],
+                         'wealth_threshold_single':1760000*1.03**2,'wealth_high_threshold':20700000*1.03**2})
+    assert df['income_tax'].iloc[3]==pytest.approx(TaxEngine(indexed).income_tax(gross[3]))
+    assert df['wealth_tax'].iloc[3]==pytest.approx(TaxEngine(indexed).wealth_tax(net[3]))
+    table={**asdict(TaxConfig()),'bracket_rates':[0.0,0.1]}
+    (tmp_path/'bad.json').write_text(json.dumps(table))
+    with pytest.raises(ValueError):
+        config_from_file(str(tmp_path/'bad.json'))
+
+def test_optimize_allocation_scores_with_projection():
+    from finance import Person, Investment, Loan, Simulation, optimize_allocation
+    p=Person('a',800000,0.25,300000,investments=[Investment(5e5,0.06),Investment(1e5,0.04,account_type='ASK')],loans=[Loan(3e6,0.05,25)])
+    same=optimize_allocation(p,30,ips_contribution=[0],ask_share=[1/6],extra_payment=[0],max_workers=1)
+    assert same['best']['total_wealth_tax']==pytest.approx(Simulation().project_yearly(p,30)['wealth_tax'].sum())
+    res=optimize_allocation(p,30,max_workers=1)
+    assert len(res['table'])==6*5*6 and res['best']['after_tax_real_wealth']>=res['current']['after_tax_real_wealth']
+    assert res['best']['ips_contribution']==15000 and res['best']['ips_tax_saving']>0
+    costly=optimize_allocation(Person('b',800000,0.25,300000,investments=[Investment(5e5,0.03)],loans=[Loan(3e6,0.09,25)]),30,objective='fire',max_workers=1)
+    assert costly['best']['extra_payment']>0
+    with pytest.raises(ValueError):
+        optimize_allocation(p,objective='speed')
+
+def test_sensitivities_match_bumped_projections():
+    from dataclasses import replace
+    from finance import Person, Investment, Loan, Simulation, TaxConfig
+    p=Person('a',800000,0.25,300000,investments=[Investment(5e5,0.06),Investment(2e5,0.04,account_type='ASK')],
+             loans=[Loan(3e6,0.09,40)],salary_growth=0.02,ips_contribution=15000)
+    tab=Simulation().sensitivities(p,30)
+    assert set(tab['metric'])=={'net_wealth','real_net_wealth','years_to_fire','total_tax'} and 'charity_donation' not in set(tab['parameter'])
+    nw=tab[tab['metric']=='net_wealth'].set_index('parameter')
+    assert nw['swing'].is_monotonic_decreasing
+    final=lambda person=p,cfg=TaxConfig(),inflation=0.02: Simulation(cfg).project_yearly(person,30,inflation)['net_wealth'].iloc[-1]
+    assert nw.loc['loans[0].annual_rate','high']==pytest.approx(final(replace(p,loans=[replace(p.loans[0],annual_rate=0.09*1.01)])))
+    assert nw.loc['investments[0].principal','low']==pytest.approx(final(replace(p,investments=[replace(p.investments[0],principal=5e5*0.99),p.investments[1]])))
+    tax=tab[tab['metric']=='total_tax'].set_index('parameter')
+    df=Simulation(replace(TaxConfig(),wealth_threshold_single=1760000*1.01)).project_yearly(p,30)
+    assert tax.loc['tax.wealth_threshold_single','high']==pytest.approx((df['income_tax']+df['wealth_tax']).sum())
+    row=nw.loc['salary']
+    assert row['elasticity']==pytest.approx((row['high']-row['low'])/(0.02*row['base']))
+    fire=tab[tab['metric']=='years_to_fire'].set_index('parameter')
+    assert fire.loc['expenses','elasticity']>0 and fire.loc['salary','elasticity']<0
+
+def test_profiler_records_stages_only_when_active():
+    import json
+    from finance import Person, Loan, Investment, Simulation, Profiler
+    from finance.profiling import active
+    p=Person('a',700000,0.2,300000,loans=[Loan(2e6,0.05,25)],investments=[Investment(3e5,0.06)])
+    sim=Simulation()
+    prof=Profiler()
+    sim.project_yearly(p,20)
+    assert active() is None and not prof.counts
+    run=prof(lambda: sim.project_yearly(p,20))
+    run(); run()
+    t=prof.to_dict()
+    assert active() is None and {'Simulation.project_yearly','inputs','loans','growth','tax','frame'}<=set(t['stages'])
+    assert t['stages']['Simulation.project_yearly']['calls']==2
+    top=t['stages']['Simulation.project_yearly']
+    assert top['self_ms']<top['total_ms']<=t['wall_ms']
+    events=json.loads(json.dumps(prof.chrome_trace()))['traceEvents']
+    assert len(events)==sum(prof.counts.values()) and all(e['ph']=='X' and e['dur']>=0 for e in events)
+
+def _run_imports(code):
+    # fresh interpreter with -X importtime; returns the heavy optional modules loaded and the
+    # cumulative microseconds of each top-level import
+    import os, subprocess, sys
+    code+="\nimport sys; print(','.join(m for m in ('pandas','tabulate','plotly','openpyxl','pyarrow','yaml') if m in sys.modules))"
+    res=subprocess.run([sys.executable,'-X','importtime','-c',code],capture_output=True,text=True,check=True,cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    times={}
+    for line in res.stderr.splitlines():
+        parts=line.split('|')
+        if line.startswith('import time:') and parts[1].strip().isdigit() and not parts[2].startswith('  '):
+            times[parts[2].strip()]=int(parts[1])
+    return set(filter(None,res.stdout.strip().split(','))),times
+
+def test_core_engines_import_without_pandas():
+    loaded,times=_run_imports("import finance.models, finance.loans, finance.tax, finance.simulation\nimport pandas")
+    assert 'tabulate' not in loaded
+    core=sum(v for k,v in times.items() if k.startswith('finance'))
+    assert core<times['pandas'], f"core engines took {core/1e3:.0f} ms, pandas {times['pandas']/1e3:.0f} ms"
+    loaded,_=_run_imports("from finance import Person, Loan, Simulation, amortize, TaxConfig, TaxEngine\n"
+                          "Simulation()._columns(Person('a',5e5,.2,2e5,loans=[Loan(1e6,.05,20)]),10); amortize(Loan(1e6,.05,20)); TaxEngine(TaxConfig()).income_tax(6e5)")
+    assert loaded==set()
+    loaded,_=_run_imports("from finance import Person, Simulation\nsim=Simulation(); sim.format_table(sim.project_yearly(Person('a',5e5,.2,2e5),10))")
+    assert {'pandas','tabulate'}<=loaded and not loaded&{'plotly','openpyxl'}
+    loaded,_=_run_imports("import finance\nfinance.tax.TaxEngine; finance.loans.amortize; assert finance.simulation.Simulation is finance.Simulation")
+    assert loaded==set()
+
+def test_per_month_paths_in_monthly_and_yearly_projections():
+    from finance import Person, Simulation
+    sim=Simulation()
+    salary=np.repeat([600000.0,1200000.0,1200000.0],12)
+    m=sim.project_monthly(Person('a',salary,0.2,300000),years=3,inflation=np.r_[np.full(12,0.1),np.zeros(24)])
+    assert m['gross_salary'].tolist()==pytest.approx([50000]*12+[100000]*24)
+    deflator=m['net_wealth']/m['real_net_wealth']
+    assert deflator.iloc[[11,23,35]].tolist()==pytest.approx([1.1,1.1,1.1])
+    rate=np.r_[np.full(6,0.1),np.full(30,0.3)]
+    m=sim.project_monthly(Person('a',600000,rate,300000),years=3)
+    assert m['saved'].tolist()==pytest.approx(list(50000*rate))
+    with pytest.raises(ValueError):
+        sim.project_yearly(Person('a',600000,rate,300000),years=3)
+    with pytest.raises(ValueError):
+        sim.project_yearly(Person('a',salary,0.2,300000),years=3)